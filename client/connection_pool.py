@@ -0,0 +1,60 @@
+import atexit
+import imaplib
+import logging
+import smtplib
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, TypeVar, Union
+
+Connection = Union[imaplib.IMAP4, smtplib.SMTP]
+C = TypeVar('C', imaplib.IMAP4, smtplib.SMTP)
+
+# Idle authenticated connections, keyed by (protocol, host, port, username)
+_POOL: Dict[Hashable, List[Connection]] = {}
+_POOL_LOCK = threading.Lock()
+
+def _is_alive(conn: Connection) -> bool:
+    """Probe a pooled connection with NOOP."""
+    try:
+        reply = conn.noop()
+    except Exception:
+        return False
+    if isinstance(conn, smtplib.SMTP):
+        return reply[0] == 250
+    return reply[0] == 'OK'
+
+def _close(conn: Connection) -> None:
+    try:
+        if isinstance(conn, smtplib.SMTP):
+            conn.quit()
+        else:
+            conn.logout()
+    except Exception:
+        pass
+
+def acquire(key: Hashable, connect: Callable[[], Optional[C]]) -> Optional[C]:
+    """Get an idle connection for key if one is still alive, otherwise open one with connect()."""
+    while True:
+        with _POOL_LOCK:
+            idle = _POOL.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return connect()
+        if _is_alive(conn):
+            logging.debug("Reusing pooled connection for %s", key)
+            return conn
+        _close(conn)
+
+def release(key: Hashable, conn: Connection) -> None:
+    """Return a connection to the pool so later operations can reuse it."""
+    with _POOL_LOCK:
+        _POOL.setdefault(key, []).append(conn)
+
+def close_all() -> None:
+    """Log out of every pooled connection."""
+    with _POOL_LOCK:
+        conns = [conn for idle in _POOL.values() for conn in idle]
+        _POOL.clear()
+    for conn in conns:
+        _close(conn)
+
+atexit.register(close_all)
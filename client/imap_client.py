@@ -3,22 +3,95 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 from config_reader import ConfigLoader
+from client import connection_pool
 if len(sys.argv) > 1:
     configs = ConfigLoader(sys.argv[1])
 else:
     configs = ConfigLoader()
 
 import imaplib
-import email
+import hashlib
 import os
 import ssl
 import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from email import policy
-from typing import List, Tuple
+from email.parser import BytesParser
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Set, Tuple
 from getpass import getpass
 
+try:
+    import imap_utf7
+except ImportError:
+    imap_utf7 = None
+
+# Messages requested per FETCH command while replicating a mailbox
+FETCH_BATCH_SIZE = 200
+# FETCH commands written ahead of the oldest unanswered one
+PIPELINE_DEPTH = 4
+# Mailboxes replicated at once, each over its own connection
+MAX_IMAP_CONNECTIONS = 8
+# Consecutive connection failures before backing off, and before giving up
+CONNECT_BACKOFF_AFTER = 3
+CONNECT_GIVE_UP_AFTER = 5
+CONNECT_BACKOFF_SECONDS = 15
+# Per-user record of what has already been replicated, kept in the local mail directory
+SYNC_STATE_FILE = 'state.sqlite'
+
+_UID_RE = re.compile(rb'UID\s+(\d+)')
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w\-.]')
+# (<flags>) <delimiter> <name>, where the name is a quoted string or an atom
+_LIST_RE = re.compile(rb'\([^)]*\) (?:"(?:[^"\\]|\\.)*"|NIL) (?:"((?:[^"\\]|\\.)*)"|(\S+))')
+_QUOTED_ESCAPE_RE = re.compile(rb'\\(.)')
+_UIDVALIDITY_RE = re.compile(rb'UIDVALIDITY\s+(\d+)')
+_UIDNEXT_RE = re.compile(rb'UIDNEXT\s+(\d+)')
+
+_HEADER_PARSER = BytesParser(policy=policy.default)
+
+# Directories save_email has already created during this run
+_ENSURED_DIRS: Set[str] = set()
+
+class PipelinedFetcher:
+    """Keeps several FETCH commands in flight on one imaplib connection.
+
+    imaplib waits for each tagged response before sending the next command. RFC 3501
+    allows FETCHes on the selected mailbox to be pipelined, so up to `depth` commands
+    are written ahead and their responses are collected in the order they were sent.
+    """
+
+    def __init__(self, imap: imaplib.IMAP4, depth: int = PIPELINE_DEPTH, uid: bool = False):
+        self.imap = imap
+        self.depth = depth
+        # UID FETCH takes UID sets instead of sequence sets
+        self.command: Tuple[str, ...] = ('UID', 'FETCH') if uid else ('FETCH',)
+
+    def fetch(self, message_sets: List[str], message_parts: str) -> Iterator[Tuple[str, str, list]]:
+        """Yield (message_set, status, data) for each message set, in order"""
+        pending: Deque[Tuple[str, bytes]] = deque()
+        for message_set in message_sets:
+            pending.append((message_set, self.imap._command(*self.command, message_set, message_parts)))
+            if len(pending) >= self.depth:
+                yield self._complete(*pending.popleft())
+        while pending:
+            yield self._complete(*pending.popleft())
+
+    def _complete(self, message_set: str, tag: bytes) -> Tuple[str, str, list]:
+        # Responses arrive in command order, so the untagged FETCH data collected
+        # up to this tag belongs to this command alone
+        try:
+            typ, dat = self.imap._command_complete(self.command[0], tag)
+        except self.imap.error as e:
+            return message_set, 'BAD', [str(e).encode()]
+        typ, dat = self.imap._untagged_response(typ, dat, 'FETCH')
+        return message_set, typ, dat
+
 def list_mailboxes(imap: imaplib.IMAP4) -> List[str]:
-    """List all available mailboxes/folders."""
+    """List all available mailboxes/folders, as named on the server."""
     status, mailbox_list = imap.list()
     if status != 'OK':
         logging.error(f"Error listing mailboxes: {mailbox_list}")
@@ -26,36 +99,162 @@ def list_mailboxes(imap: imaplib.IMAP4) -> List[str]:
     
     mailboxes: List[str] = []
     for mb in mailbox_list:
-        # Explicitly check if element is bytes before decoding
-        if isinstance(mb, bytes):
-            decoded = mb.decode('utf-8')  # Specify encoding explicitly
-        else:
-            # Fallback to string conversion if not bytes
-            decoded = str(mb)
+        # Names sent as literals arrive as (b'(<flags>) "<delim>" {<size>}', b'<name>')
+        if isinstance(mb, tuple):
+            mailboxes.append(mb[1].decode('utf-8', errors='replace'))
+            continue
         
-        if '"' in decoded:
-            mailbox_name = decoded.split('"')[-2]
-            mailboxes.append(mailbox_name)
+        match = _LIST_RE.match(mb) if isinstance(mb, bytes) else None
+        if match is None:
+            logging.warning(f"Unrecognized LIST response: {mb!r}")
+            continue
+        if match.group(1) is not None:
+            name = _QUOTED_ESCAPE_RE.sub(rb'\1', match.group(1))
+        else:
+            name = match.group(2)
+        mailboxes.append(name.decode('utf-8', errors='replace'))
     return mailboxes
 
+def decode_mailbox_name(mailbox_name: str) -> str:
+    """Decode a modified UTF-7 mailbox name (RFC 3501 5.1.3) for use as a local directory name."""
+    if imap_utf7 is None or '&' not in mailbox_name:
+        return mailbox_name
+    try:
+        return imap_utf7.decode(mailbox_name.encode('ascii'))
+    except (UnicodeError, ValueError):
+        return mailbox_name
+
+def ensure_dir(path: str) -> None:
+    """Create a directory once per run; later calls skip the mkdir syscall."""
+    if path not in _ENSURED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _ENSURED_DIRS.add(path)
+
 def save_email(mailbox_path: str, message_data: bytes) -> None:
     """Save an email message to the specified mailbox directory."""
-    msg = email.message_from_bytes(message_data, policy=policy.default)
-    message_id = msg.get('Message-ID', f'msg-{hash(msg.as_string())}.eml')
-    filename = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in message_id)
+    # Only the Message-ID is needed, so skip parsing the body and attachments
+    msg = _HEADER_PARSER.parsebytes(message_data, headersonly=True)
+    # Hash the raw bytes for the fallback name rather than re-serializing the message
+    message_id = msg.get('Message-ID') or f'msg-{hashlib.blake2b(message_data, digest_size=8).hexdigest()}.eml'
+    filename = _UNSAFE_FILENAME_RE.sub('_', message_id)
     
-    os.makedirs(mailbox_path, exist_ok=True)
+    ensure_dir(mailbox_path)
     
-    with open(os.path.join(mailbox_path, filename), 'wb') as f:
-        f.write(message_data)
+    # One unbuffered write; the message is already a single bytes object
+    fd = os.open(os.path.join(mailbox_path, filename), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        view = memoryview(message_data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
     logging.info(f"Saved message: {filename}")
 
-def replicate_mailbox(imap: imaplib.IMAP4, mailbox_name: str, local_dir: str) -> None:
+class SyncState:
+    """UIDVALIDITY and last saved UID per mailbox, kept in SQLite between runs."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # Shared by the replication workers; the lock serializes access
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS mailboxes "
+                             "(name TEXT PRIMARY KEY, uidvalidity INTEGER, last_uid INTEGER)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def get(self, mailbox_name: str) -> Optional[Tuple[int, int]]:
+        """Return (uidvalidity, last_uid) recorded for a mailbox, if any."""
+        with self._lock:
+            row = self._db.execute("SELECT uidvalidity, last_uid FROM mailboxes WHERE name = ?",
+                                   (mailbox_name,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, mailbox_name: str, uidvalidity: int, last_uid: int) -> None:
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO mailboxes (name, uidvalidity, last_uid) VALUES (?, ?, ?)",
+                             (mailbox_name, uidvalidity, last_uid))
+
+    def get_meta(self, key: str, default: int = 0) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: int) -> None:
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def get_mailbox_status(imap: imaplib.IMAP4, mailbox_name: str) -> Optional[Tuple[int, int]]:
+    """Return (UIDVALIDITY, UIDNEXT) for a mailbox without selecting it."""
+    try:
+        status, data = imap.status(mailbox_name, '(UIDVALIDITY UIDNEXT)')
+    except imaplib.IMAP4.error as e:
+        logging.warning(f"STATUS failed for mailbox {mailbox_name}: {e}")
+        return None
+    if status != 'OK' or not data or not isinstance(data[0], bytes):
+        return None
+    
+    uidvalidity = _UIDVALIDITY_RE.search(data[0])
+    uidnext = _UIDNEXT_RE.search(data[0])
+    if not uidvalidity or not uidnext:
+        return None
+    return int(uidvalidity.group(1)), int(uidnext.group(1))
+
+class BatchedMailWriter:
+    """Saves fetched messages on a background thread so disk writes overlap with FETCH traffic."""
+
+    def __init__(self, mailbox_path: str):
+        self.mailbox_path = mailbox_path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending: List[Tuple[str, Future]] = []
+
+    def submit(self, uid: str, message_data: bytes) -> None:
+        """Queue a message to be written by save_email."""
+        self._pending.append((uid, self._executor.submit(save_email, self.mailbox_path, message_data)))
+
+    def wait(self) -> int:
+        """Wait for all queued messages to be written, returning how many failed."""
+        failures = 0
+        for uid, future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Exception saving email UID {uid}: {e}")
+                failures += 1
+        self._pending.clear()
+        return failures
+
+    def __enter__(self) -> 'BatchedMailWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.wait()
+        self._executor.shutdown()
+
+def replicate_mailbox(imap: imaplib.IMAP4, mailbox_name: str, local_dir: str,
+                      state: Optional[SyncState] = None) -> None:
     #Replicate a single mailbox.
     logging.info(f"Replicating mailbox: {mailbox_name}")
     
+    # With sync state, only messages newer than the last saved UID are fetched
+    last_uid = 0
+    uidvalidity = None
+    if state is not None:
+        mailbox_status = get_mailbox_status(imap, mailbox_name)
+        if mailbox_status is not None:
+            uidvalidity, uidnext = mailbox_status
+            recorded = state.get(mailbox_name)
+            if recorded is not None and recorded[0] == uidvalidity:
+                if uidnext == recorded[1] + 1:
+                    logging.info(f"Mailbox {mailbox_name} unchanged since last sync")
+                    return
+                last_uid = recorded[1]
+    
     status, data = imap.select(mailbox_name, readonly=True)
-    logging.debug(f"Select({mailbox_name}) => status: {status}, data: {data}")
+    logging.debug("Select(%s) => status: %s, data: %s", mailbox_name, status, data)
     if status != 'OK':
         logging.error(f"Error selecting mailbox {mailbox_name}: {data}")
         return
@@ -66,67 +265,62 @@ def replicate_mailbox(imap: imaplib.IMAP4, mailbox_name: str, local_dir: str) ->
         return
 
     message_count = int(data[0])
-    logging.debug(f"Message count in {mailbox_name}: {message_count}")
+    logging.debug("Message count in %s: %d", mailbox_name, message_count)
     
     if message_count == 0:
         logging.warning(f"No messages in mailbox {mailbox_name}")
         return
     
-    local_mailbox_dir = os.path.join(local_dir, mailbox_name)
-    os.makedirs(local_mailbox_dir, exist_ok=True)
+    local_mailbox_dir = os.path.join(local_dir, decode_mailbox_name(mailbox_name))
+    ensure_dir(local_mailbox_dir)
     
-    fetch_uid = "1:*"
-    fetch_items = "(UID)"
-    status, msg_data = imap.fetch(fetch_uid, fetch_items)
-    logging.debug(f"Fetch({fetch_uid} {fetch_items}) => status: {status}, msg_data: {msg_data}")
-    if status != 'OK':
-        logging.error(f"Error fetching UIDs: {msg_data}")
-        return
-
-    uids: List[str] = []
-    for idx, response in enumerate(msg_data):
-        logging.debug(f"msg_data[{idx}]: {response!r}")
-        line = None
-        if isinstance(response, tuple):
-            line = response[0]
-            logging.debug(f"Response is tuple, line: {line!r}")
-        elif isinstance(response, bytes):
-            line = response
-            logging.debug(f"Response is bytes, line: {line!r}")
-        else:
-            logging.debug(f"Response is unknown type: {type(response)}")
-            continue
+    fetch_items = "(UID RFC822)"
+    if last_uid:
+        # New mail is usually a handful of messages, so one UID range covers it
+        fetcher = PipelinedFetcher(imap, uid=True)
+        fetch_ranges = [f"{last_uid + 1}:*"]
+    else:
+        # Fetch bodies in sequence ranges rather than one UID FETCH per message
+        fetcher = PipelinedFetcher(imap)
+        fetch_ranges = [f"{start}:{min(start + FETCH_BATCH_SIZE - 1, message_count)}"
+                        for start in range(1, message_count + 1, FETCH_BATCH_SIZE)]
+    
+    saved_uid = last_uid
+    record_progress = state is not None and uidvalidity is not None
+    with BatchedMailWriter(local_mailbox_dir) as writer:
+        for fetch_range, status, msg_data in fetcher.fetch(fetch_ranges, fetch_items):
+            logging.info(f"Fetched messages {fetch_range} of {message_count}")
+            if status != 'OK':
+                logging.error(f"Error fetching messages {fetch_range}: {msg_data}")
+                # A later batch must not record a UID past the messages this one missed
+                record_progress = False
+                continue
 
-        if not line:
-            logging.debug(f"Line is empty, skipping")
-            continue
+            batch_uid = saved_uid
+            for response in msg_data:
+                # Literal responses come as (b'<seq> (UID <uid> RFC822 {<size>}', raw_email),
+                # followed by a closing b')' entry that carries no data
+                if not isinstance(response, tuple):
+                    continue
 
-        try:
-            parts = line.decode().replace('(', '').replace(')', '').split()
-            logging.debug(f"Parts: {parts}")
-            if 'UID' in parts:
-                idx_uid = parts.index('UID')
-                if idx_uid + 1 < len(parts):
-                    uids.append(parts[idx_uid + 1])
-                    logging.debug(f"Found UID: {parts[idx_uid + 1]}")
-        except Exception as e:
-            logging.warning(f"Exception decoding line: {e}, line: {line!r}")
-
-    logging.debug(f"Found UIDs: {uids} in mailbox {mailbox_name}")
-
-    for uid in uids:
-        logging.info(f"Fetching message UID {uid} of {message_count}...")
-        status, msg_data = imap.uid('FETCH', uid, "(RFC822)")
-        if status != 'OK':
-            logging.error(f"Error fetching message UID {uid}: {msg_data}")
-            continue
+                match = _UID_RE.search(response[0])
+                uid = int(match.group(1)) if match else 0
+                # "<n>:*" always includes the highest UID, even when it is below n
+                if match and uid <= last_uid:
+                    continue
+                raw_email = response[1]
+                logging.debug("Retrieved email UID %d, size: %d bytes", uid, len(raw_email))
+                writer.submit(str(uid), raw_email)
+                batch_uid = max(batch_uid, uid)
 
-        try:
-            raw_email = msg_data[0][1]
-            logging.debug(f"Retrieved email UID {uid}, size: {len(raw_email)} bytes")
-            save_email(local_mailbox_dir, raw_email)
-        except Exception as e:
-            logging.error(f"Exception saving email UID {uid}: {e}")
+            # Only record progress once the batch is on disk
+            if record_progress:
+                if writer.wait() == 0:
+                    saved_uid = batch_uid
+                    state.set(mailbox_name, uidvalidity, saved_uid)
+                else:
+                    # Leave the failed messages to be fetched again next run
+                    record_progress = False
 
 def authenticate_plain(imap: imaplib.IMAP4, username: str, password: str) -> Tuple[str, str]:
     """Authenticate using PLAIN method."""
@@ -134,14 +328,8 @@ def authenticate_plain(imap: imaplib.IMAP4, username: str, password: str) -> Tup
     auth_bytes = auth_string.encode('utf-8')
     return imap.authenticate('PLAIN', lambda x: auth_bytes)
 
-def main():
-    username = input("Enter email username: ")
-    password = getpass("Enter email password: ")
-    
-    local_dir = os.path.join(
-        configs.client_storage_path, username)
-    os.makedirs(local_dir, exist_ok=True)
-    
+def open_imap() -> Optional[imaplib.IMAP4]:
+    """Connect to the IMAP server, preferring SSL and falling back to STARTTLS or plain."""
     logging.info(f"Connecting to IMAP server at {configs.host_name}:{configs.imap_port}...")
     
     try:
@@ -162,32 +350,153 @@ def main():
                 logging.warning("Using plain connection (no encryption)")
         except Exception as conn_err:
             logging.error(f"Connection failed: {conn_err}")
-            return
+            return None
+    return imap
+
+def connect_imap(username: str, password: str) -> Optional[imaplib.IMAP4]:
+    """Open a new connection and authenticate it."""
+    imap = open_imap()
+    if imap is None:
+        return None
     
     try:
         logging.info(f"Authenticating as {username}...")
         status, data = authenticate_plain(imap, username, password)
         if status != 'OK':
             logging.error(f"Authentication failed: {data}")
-            return
-        
-        logging.info("Authentication successful")
-        
+            imap.logout()
+            return None
+    except Exception as e:
+        logging.error(f"Authentication failed: {e}")
+        try:
+            imap.logout()
+        except:
+            pass
+        return None
+    
+    logging.info("Authentication successful")
+    return imap
+
+def _pool_key(username: str) -> Tuple[str, str, int, str]:
+    return ('imap', configs.host_name, configs.imap_port, username)
+
+def get_imap(username: str, password: str) -> Optional[imaplib.IMAP4]:
+    """Get an authenticated connection, reusing an idle pooled one when possible."""
+    return connection_pool.acquire(_pool_key(username), lambda: connect_imap(username, password))
+
+def release_imap(username: str, imap: imaplib.IMAP4) -> None:
+    """Return a connection to the pool; pooled connections are logged out at exit."""
+    connection_pool.release(_pool_key(username), imap)
+
+class ConnectCircuitBreaker:
+    """Backs off after consecutive connection failures and gives up after too many."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+
+    @property
+    def tripped(self) -> bool:
+        return self._failures >= CONNECT_GIVE_UP_AFTER
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            failures = self._failures
+        if CONNECT_BACKOFF_AFTER <= failures < CONNECT_GIVE_UP_AFTER:
+            logging.warning(f"{failures} consecutive connection failures, backing off {CONNECT_BACKOFF_SECONDS}s")
+            time.sleep(CONNECT_BACKOFF_SECONDS)
+
+def replicate_mailbox_on_new_connection(mailbox_name: str, username: str, password: str,
+                                        local_dir: str, breaker: ConnectCircuitBreaker,
+                                        state: Optional[SyncState] = None) -> None:
+    """Replicate a single mailbox over its own authenticated connection."""
+    if breaker.tripped:
+        logging.warning(f"Skipping mailbox {mailbox_name}: too many connection failures")
+        return
+    
+    imap = get_imap(username, password)
+    if imap is None:
+        breaker.record_failure()
+        return
+    breaker.record_success()
+    
+    try:
+        replicate_mailbox(imap, mailbox_name, local_dir, state)
+    except Exception as e:
+        logging.exception(f"Error replicating mailbox {mailbox_name}: {e}")
+        try:
+            imap.logout()
+        except:
+            pass
+    else:
+        release_imap(username, imap)
+
+def choose_mailboxes(mailboxes: List[str], state: SyncState) -> List[str]:
+    """Pick INBOX, the watched mailboxes and the next few others in rotation."""
+    watched = set(configs.watched_mailboxes)
+    always = [mb for mb in mailboxes if mb.upper() == 'INBOX' or mb in watched]
+    others = sorted(mb for mb in mailboxes if mb not in always)
+    if not others:
+        return always
+    
+    # The cursor persists between runs, so every mailbox is visited in turn
+    sample_size = min(configs.mailbox_sample_size, len(others))
+    cursor = state.get_meta('rotation_cursor') % len(others)
+    sample = (others[cursor:] + others[:cursor])[:sample_size]
+    state.set_meta('rotation_cursor', (cursor + sample_size) % len(others))
+    
+    skipped = len(others) - len(sample)
+    if skipped:
+        logging.info(f"Skipping {skipped} unwatched mailboxes this run")
+    return always + sample
+
+def replicate_mailboxes(mailboxes: List[str], username: str, password: str, local_dir: str) -> None:
+    """Replicate mailboxes concurrently, one connection per mailbox being copied."""
+    if not mailboxes:
+        return
+    
+    breaker = ConnectCircuitBreaker()
+    state = SyncState(os.path.join(local_dir, SYNC_STATE_FILE))
+    mailboxes = choose_mailboxes(mailboxes, state)
+    workers = min(len(mailboxes), MAX_IMAP_CONNECTIONS)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(
+                lambda mailbox: replicate_mailbox_on_new_connection(mailbox, username, password, local_dir,
+                                                                    breaker, state),
+                mailboxes))
+    finally:
+        state.close()
+
+def main():
+    username = input("Enter email username: ")
+    password = getpass("Enter email password: ")
+    
+    local_dir = os.path.join(
+        configs.client_storage_path, username)
+    os.makedirs(local_dir, exist_ok=True)
+    
+    imap = get_imap(username, password)
+    if imap is None:
+        return
+    
+    try:
         mailboxes = list_mailboxes(imap)
         logging.info(f"Found {len(mailboxes)} mailboxes: {', '.join(mailboxes)}")
         
-        for mailbox in mailboxes:
-            replicate_mailbox(imap, mailbox, local_dir)
+        # Hand the listing connection back so one of the workers can reuse it
+        release_imap(username, imap)
+        replicate_mailboxes(mailboxes, username, password, local_dir)
         
         logging.info(f"Mail replication complete. Local copy saved to: {local_dir}")
         
     except Exception as e:
         logging.exception(f"An error occurred: {e}")
-    finally:
-        try:
-            imap.logout()
-        except:
-            pass
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
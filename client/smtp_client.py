@@ -3,39 +3,137 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 from config_reader import ConfigLoader
+from client import connection_pool
 if len(sys.argv) > 1:
     configs = ConfigLoader(sys.argv[1])
 else:
     configs = ConfigLoader()
 
+import re
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from getpass import getpass
+from typing import Dict, Sequence, Tuple, Union
+
+_LINE_END_RE = re.compile(r'(?:\r\n|\n|\r(?!\n))')
+_LEADING_DOT_RE = re.compile(br'(?m)^\.')
+
+class PipelinedSMTP(smtplib.SMTP):
+    """SMTP connection that sends MAIL FROM, every RCPT TO and DATA in one write when the server allows PIPELINING (RFC 2920)."""
+
+    def sendmail(self, from_addr: str, to_addrs: Union[str, Sequence[str]], msg: Union[str, bytes],
+                 mail_options: Sequence[str] = (), rcpt_options: Sequence[str] = ()) -> Dict[str, Tuple[int, bytes]]:
+        self.ehlo_or_helo_if_needed()
+        if not self.has_extn('pipelining'):
+            return super().sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+        if isinstance(msg, str):
+            msg = _LINE_END_RE.sub('\r\n', msg).encode('ascii')
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        esmtp_opts = list(mail_options)
+        if self.has_extn('size'):
+            esmtp_opts.insert(0, f"size={len(msg)}")
+        if any(opt.lower() == 'smtputf8' for opt in esmtp_opts):
+            if not self.has_extn('smtputf8'):
+                raise smtplib.SMTPNotSupportedError('SMTPUTF8 not supported by server')
+            self.command_encoding = 'utf-8'
+
+        mail_args = ''.join(' ' + opt for opt in esmtp_opts)
+        rcpt_args = ''.join(' ' + opt for opt in rcpt_options)
+        commands = [f"mail FROM:{smtplib.quoteaddr(from_addr)}{mail_args}\r\n"]
+        commands.extend(f"rcpt TO:{smtplib.quoteaddr(rcpt)}{rcpt_args}\r\n" for rcpt in to_addrs)
+        commands.append("data\r\n")
+        self.send(''.join(commands))
+
+        # Collect every reply before acting on any of them so the stream stays in step
+        mail_reply = self.getreply()
+        rcpt_replies = [self.getreply() for _ in to_addrs]
+        data_reply = self.getreply()
+
+        if mail_reply[0] != 250:
+            if mail_reply[0] == 421:
+                self.close()
+            else:
+                self._pipeline_abort(data_reply[0])
+            raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+
+        senderrs: Dict[str, Tuple[int, bytes]] = {}
+        for rcpt, (code, resp) in zip(to_addrs, rcpt_replies):
+            if code not in (250, 251):
+                senderrs[rcpt] = (code, resp)
+            if code == 421:
+                self.close()
+                raise smtplib.SMTPRecipientsRefused(senderrs)
+        if len(senderrs) == len(to_addrs):
+            self._pipeline_abort(data_reply[0])
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+
+        if data_reply[0] != 354:
+            self._pipeline_abort(data_reply[0])
+            raise smtplib.SMTPDataError(*data_reply)
+
+        payload = _LEADING_DOT_RE.sub(b'..', msg)
+        if payload[-2:] != b'\r\n':
+            payload += b'\r\n'
+        self.send(payload + b'.\r\n')
+        code, resp = self.getreply()
+        if code != 250:
+            if code == 421:
+                self.close()
+            else:
+                self._rset()
+            raise smtplib.SMTPDataError(code, resp)
+        return senderrs
+
+    def _pipeline_abort(self, data_code: int) -> None:
+        """Reset the transaction after a pipelined failure; a DATA the server opened anyway cannot be cancelled."""
+        if data_code == 354:
+            self.close()
+        else:
+            self._rset()
+
+def connect_smtp(username: str, password: str) -> smtplib.SMTP:
+    """Open a new SMTP connection, upgrade it to TLS and log in."""
+    server = PipelinedSMTP(configs.host_name, configs.smtp_port, timeout=10)
+    try:
+        server.starttls()  # Upgrade the connection to a secure encrypted SSL/TLS connection
+        server.login(username, password)  # Log in to the server
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def _pool_key(username: str) -> Tuple[str, str, int, str]:
+    return ('smtp', configs.host_name, configs.smtp_port, username)
+
+def get_smtp(username: str, password: str) -> smtplib.SMTP:
+    """Get a logged-in SMTP connection, reusing an idle pooled one when possible."""
+    return connection_pool.acquire(_pool_key(username), lambda: connect_smtp(username, password))
 
 if __name__ == "__main__":
     username = input("Enter email username: ")
     password = getpass("Enter email password: ")
     try:
         # Connect to the SMTP server
-        with smtplib.SMTP(configs.host_name, configs.smtp_port, timeout=10) as server:
-            server.starttls()  # Upgrade the connection to a secure encrypted SSL/TLS connection
-            server.login(username, password)  # Log in to the server
-            to_email = input("Enter recipient email: ")
-            subject = input("Enter email subject: ")
-            body = input("Enter email body: ")
+        server = get_smtp(username, password)
+        to_email = input("Enter recipient email: ")
+        subject = input("Enter email subject: ")
+        body = input("Enter email body: ")
 
-            # Create the email
-            msg = MIMEMultipart()
-            msg['From'] = username
-            msg['To'] = to_email
-            msg['Subject'] = subject
+        # Create the email
+        msg = MIMEMultipart()
+        msg['From'] = username
+        msg['To'] = to_email
+        msg['Subject'] = subject
 
-            # Attach the email body
-            msg.attach(MIMEText(body, 'plain'))
+        # Attach the email body
+        msg.attach(MIMEText(body, 'plain'))
 
 
-            server.send_message(msg)  # Send the email
-            print("Email sent successfully!")
+        server.send_message(msg)  # Send the email
+        connection_pool.release(_pool_key(username), server)
+        print("Email sent successfully!")
     except Exception as e:
         print(f"Failed to send email: {e}")
\ No newline at end of file
@@ -1,83 +1,83 @@
+import atexit
 import json
 import logging
-from typing import Dict, Any
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from types import MappingProxyType
+from typing import Dict, Any, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
 
 
 class ConfigLoader:
     
     def __init__(self, config_file_path: str = "config.json"):
         self.config_file_path = config_file_path
-        self.config = self._load_config()
+        # Read-only view; settings are copied to attributes below and never change
+        self.config = MappingProxyType(self._load_config())
         self.setup_logging()
+        
+        # Resolve settings once so call sites read plain attributes
+        self.host_name: str = self.get_config_value('server', 'host_name')
+        self.smtp_port: int = self.get_config_value('server', 'smtp_port')
+        self.imap_port: int = self.get_config_value('server', 'imap_port')
+        self.server_storage_path: str = self.get_config_value('storage', 'server_storage_path')
+        self.client_storage_path: str = self.get_config_value('storage', 'client_storage_path')
+        self.auth_type: str = self.get_config_value('authentication', 'auth_type')
+        self.ldap_server_uri: str = self.get_config_value('authentication', 'ldap_server_uri')
+        self.ldap_domain: str = self.get_config_value('authentication', 'ldap_domain')
+        self.ldap_base_dn: str = self.get_config_value('authentication', 'ldap_base_dn')
+        self.ldap_port: int = self.get_config_value('authentication', 'ldap_port')
+        self.ldap_use_ssl: bool = self.get_config_value('authentication', 'ldap_use_ssl')
+        self.users: Dict[str, str] = self.get_config_section('users')
+        # Optional; older config files have no sync section
+        sync_config = self.config.get('sync', {})
+        self.watched_mailboxes: List[str] = sync_config.get('watched_mailboxes', [])
+        self.mailbox_sample_size: int = sync_config.get('mailbox_sample_size', 10)
     
     def _load_config(self) -> Dict[str, Any]:
         try:
-            with open(self.config_file_path, 'r') as f:
-                return json.load(f)
+            with open(self.config_file_path, 'rb') as f:
+                content = f.read()
+            if orjson is not None:
+                return orjson.loads(content)
+            return json.loads(content)
         except Exception as e:
             raise Exception(f"Error in opening config file: {e}")
     
     def setup_logging(self) -> None:
         log_config = self.config['logging']
+        root = logging.getLogger()
+        # Like basicConfig, leave an already configured root logger alone
+        if root.handlers:
+            return
         
         log_level = getattr(logging, log_config['log_level'].upper())
+        formatter = logging.Formatter(log_config['log_format'])
         
-        logging.basicConfig(
-            level=log_level,
-            format=log_config['log_format'],
-            handlers=[
-                logging.StreamHandler(),
-                logging.FileHandler(log_config['log_file'])
-            ]
-        )
-    
-    @property
-    def host_name(self) -> str:
-        return self.config['server']['host_name']
-    
-    @property
-    def smtp_port(self) -> int:
-        return self.config['server']['smtp_port']
-    
-    @property
-    def imap_port(self) -> int:
-        return self.config['server']['imap_port']
-    
-    @property
-    def server_storage_path(self) -> str:
-        return self.config['storage']['server_storage_path']
-    
-    @property
-    def client_storage_path(self) -> str:
-        return self.config['storage']['client_storage_path']
-    
-    @property
-    def auth_type(self) -> str:
-        return self.config['authentication']['auth_type']
-    
-    @property
-    def ldap_server_uri(self) -> str:
-        return self.config['authentication']['ldap_server_uri']
-    
-    @property
-    def ldap_domain(self) -> str:
-        return self.config['authentication']['ldap_domain']
-    
-    @property
-    def ldap_base_dn(self) -> str:
-        return self.config['authentication']['ldap_base_dn']
-    
-    @property
-    def ldap_port(self) -> int:
-        return self.config['authentication']['ldap_port']
-    
-    @property
-    def ldap_use_ssl(self) -> bool:
-        return self.config['authentication']['ldap_use_ssl']
-    
-    @property
-    def users(self) -> Dict[str, str]:
-        return self.config['users']
+        # The file is written from a listener thread; logging calls only enqueue the record
+        file_handler = RotatingFileHandler(log_config['log_file'], maxBytes=LOG_MAX_BYTES,
+                                           backupCount=LOG_BACKUP_COUNT)
+        file_handler.setFormatter(formatter)
+        log_queue: SimpleQueue = SimpleQueue()
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        
+        # Debug output goes to the file only
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        console_handler.setLevel(max(log_level, logging.INFO))
+        
+        root.setLevel(log_level)
+        root.addHandler(QueueHandler(log_queue))
+        root.addHandler(console_handler)
     
     def get_config_section(self, section: str) -> Dict[str, Any]:
         if section not in self.config:
@@ -1,10 +1,53 @@
 from mailbox import MaildirMessage
+import logging
 import time
 import re
+from functools import lru_cache
 from email.utils import formatdate, parseaddr
 from email.message import Message
+from email.generator import BytesGenerator
+from io import BytesIO
+from types import MappingProxyType
 from email import message_from_string, message_from_bytes
-from typing import List, Optional, Callable, Dict, Sequence, Tuple, Union
+from typing import List, Optional, Callable, Dict, Mapping, Sequence, Tuple, Union
+
+# FETCH item patterns, compiled once at import instead of going through re's cache per item
+# One item: runs of plain characters, [sections], (lists) and "quoted" strings, split only on
+# top-level whitespace; an unbalanced bracket or quote is kept as part of the item
+_FETCH_ITEM_RE = re.compile(r'(?:[^\s\[\]()"]+|\[[^\]]*\]|\([^)]*\)|"[^"]*"|[\[\]()"])+')
+_HEADER_FIELDS_LIST_RE = re.compile(r'HEADER\.FIELDS\s*\((.*?)\)', re.IGNORECASE)
+_HEADER_FIELDS_NOT_LIST_RE = re.compile(r'HEADER\.FIELDS\.NOT\s*\((.*?)\)', re.IGNORECASE)
+
+_FLAG_MAPPING = {
+    'S': '\\Seen',
+    'R': '\\Answered',
+    'F': '\\Flagged',
+    'T': '\\Deleted',
+    'D': '\\Draft',
+}
+# Formatted FLAGS per Maildir info string ('\\' prefix marks \Recent); only a few dozen combinations occur
+_FLAG_CACHE: Dict[str, str] = {}
+_FLAG_CACHE_SIZE = 256
+
+_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '"': '\\"'})
+
+def _escape_string(s: str) -> str:
+    """Escape backslashes and double quotes for an IMAP quoted string"""
+    # Most header values contain neither, so skip the translate pass and return s itself
+    if not s or ('\\' not in s and '"' not in s):
+        return s
+    return s.translate(_ESCAPE_TABLE)
+
+@lru_cache(maxsize=1024)
+def _format_address(addr_string: str) -> str:
+    """Format a single address header value; the same senders and recipients recur across a mailbox"""
+    name, email = parseaddr(addr_string)
+    if '@' in email:
+        mailbox, host = email.rsplit('@', 1)
+    else:
+        mailbox, host = email, ''
+    name_part = f'"{_escape_string(name)}"' if name else 'NIL'
+    return f'(({name_part} NIL "{_escape_string(mailbox)}" "{_escape_string(host)}"))'
 
 class Helpers:
     """Helper methods for formatting IMAP responses"""
@@ -14,27 +57,87 @@ class Helpers:
         """Format address field for ENVELOPE"""
         if not addr_string:
             return 'NIL'
-        name, email = parseaddr(addr_string.strip())
-        if '@' in email:
-            mailbox, host = email.rsplit('@', 1)
-        else:
-            mailbox, host = email, ''
-        name_part = f'"{name}"' if name else 'NIL'
-        mailbox_part = f'"{mailbox}"'
-        host_part = f'"{host}"'
-        return f'(({name_part} NIL {mailbox_part} {host_part}))'
+        return _format_address(str(addr_string).strip())
+
+    @staticmethod
+    def format_flags(maildir_flags: str, recent: bool) -> str:
+        """Format Maildir info flags as an IMAP FLAGS list"""
+        key = ('\\' if recent else '') + maildir_flags
+        formatted = _FLAG_CACHE.get(key)
+        if formatted is None:
+            flags: List[str] = ['\\Recent'] if recent else []
+            # Map persistent flags
+            flags.extend(_FLAG_MAPPING[flag] for flag in maildir_flags if flag in _FLAG_MAPPING)
+            formatted = '(' + ' '.join(flags) + ')'
+            if len(_FLAG_CACHE) < _FLAG_CACHE_SIZE:
+                _FLAG_CACHE[key] = formatted
+        return formatted
+
+    @staticmethod
+    def format_literal(data: bytes) -> List[bytes]:
+        """Wrap message data in an IMAP literal, as a prefix chunk followed by the data itself (never copied)"""
+        return [b'{%d}\r\n' % len(data), data]
+
+    @staticmethod
+    def format_text_literal(text: str) -> List[bytes]:
+        """Wrap text in an IMAP literal, encoded once to the UTF-8 bytes it is counted in"""
+        return Helpers.format_literal(text.encode('utf-8'))
+
+    @staticmethod
+    def set_message_bytes(msg: MaildirMessage, data: bytes) -> None:
+        """Record the file bytes a message was parsed from, to be served in place of a re-serialization"""
+        msg._rfc822_bytes = data
+
+    @staticmethod
+    def has_message_bytes(msg: MaildirMessage) -> bool:
+        """Tell whether a message already carries its bytes"""
+        return '_rfc822_bytes' in msg.__dict__
+
+    @staticmethod
+    def get_message_bytes(msg: MaildirMessage) -> bytes:
+        """Get a message's file bytes, or serialize it without refolding headers if they were not recorded"""
+        # Cached on the message so RFC822 and RFC822.SIZE in one FETCH serialize it once;
+        # the wrapper's message cache hands the same object to later FETCHes too
+        data = msg.__dict__.get('_rfc822_bytes')
+        if data is None:
+            buffer = BytesIO()
+            BytesGenerator(buffer, mangle_from_=False, maxheaderlen=0).flatten(msg)
+            data = msg._rfc822_bytes = buffer.getvalue()
+        return data
+
+    @staticmethod
+    def get_header_map(msg: MaildirMessage) -> Dict[str, str]:
+        """Map lowercased header names to their first value, built in one pass over the headers"""
+        # Cached on the message like its bytes, so every getter in a FETCH shares one walk
+        headers = msg.__dict__.get('_header_map')
+        if headers is None:
+            headers = {}
+            for name, value in msg.items():
+                headers.setdefault(name.lower(), value)
+            msg._header_map = headers
+        return headers
 
     @staticmethod
     def get_message_headers(msg: MaildirMessage) -> str:
         """Extract headers from a message"""
-        headers = ""
-        for name, value in msg.items():
-            headers += f"{name}: {value}\r\n"
+        # Cached on the message: RFC822.HEADER and BODY[HEADER] are often asked for together
+        headers = msg.__dict__.get('_header_block')
+        if headers is None:
+            headers = msg._header_block = "".join([f"{name}: {value}\r\n" for name, value in msg.items()])
         return headers
     
     @staticmethod
     def get_message_body(msg: MaildirMessage) -> str:
         """Extract body content from a message"""
+        # Cached on the message so several TEXT items walk and decode the payload once
+        body = msg.__dict__.get('_body_text')
+        if body is None:
+            body = msg._body_text = Helpers._extract_body(msg)
+        return body
+
+    @staticmethod
+    def _extract_body(msg: MaildirMessage) -> str:
+        """Decode the message body, or its first text/plain part when multipart"""
         if not msg.is_multipart():
             payload = msg.get_payload(decode=True)
             if isinstance(payload, bytes):
@@ -56,34 +159,44 @@ class Helpers:
             return ""
 
 
+def _format_string_field(value: Optional[str]) -> str:
+    """Format an ENVELOPE string field as a quoted string or NIL"""
+    return f'"{_escape_string(str(value))}"' if value else 'NIL'
+
+# ENVELOPE fields in RFC 3501 order, keyed by lowercased header name
+_ENVELOPE_FIELDS: Tuple[Tuple[str, Callable[[Optional[str]], str]], ...] = (
+    ('date', _format_string_field),
+    ('subject', _format_string_field),
+    ('from', Helpers.format_address_field),
+    ('sender', Helpers.format_address_field),
+    ('reply-to', Helpers.format_address_field),
+    ('to', Helpers.format_address_field),
+    ('cc', Helpers.format_address_field),
+    ('bcc', Helpers.format_address_field),
+    ('in-reply-to', _format_string_field),
+    ('message-id', _format_string_field),
+)
+
 class DataGetters:
     """Contains all getter methods for FETCH items"""
     
     @staticmethod
     def get_header_value(header_name: str, default_value: str) -> Callable[[MaildirMessage], str]:
         """Create a typed header value getter function"""
+        key = header_name.lower()
+        # The fallback is constant, so quote it once here rather than on every missing header
+        quoted_default = f'"{_escape_string(default_value)}"'
         def handler(msg: MaildirMessage) -> str:
-            return f'"{msg.get(header_name) or default_value}"'
+            value = Helpers.get_header_map(msg).get(key)
+            return f'"{_escape_string(str(value))}"' if value else quoted_default
         return handler
 
     @staticmethod
     def get_flags(msg: MaildirMessage) -> str:
         """Get message flags as formatted string"""
-        maildir_flags = msg.get_flags()
-        flag_mapping = {
-            'S': '\\Seen',
-            'R': '\\Answered',
-            'F': '\\Flagged',
-            'T': '\\Deleted',
-            'D': '\\Draft',
-        }
-        flags: List[str] = []
         # Prepend \Recent for messages still in 'new' directory
-        if hasattr(msg, 'get_subdir') and msg.get_subdir() == 'new':
-            flags.append('\\Recent')
-        # Map persistent flags
-        flags.extend(flag_mapping[flag] for flag in maildir_flags if flag in flag_mapping)
-        return '(' + ' '.join(flags) + ')'
+        get_subdir = getattr(msg, 'get_subdir', None)
+        return Helpers.format_flags(msg.get_flags(), get_subdir is not None and get_subdir() == 'new')
 
     @staticmethod
     def get_internal_date(msg: MaildirMessage) -> str:
@@ -96,56 +209,28 @@ class DataGetters:
     @staticmethod
     def get_rfc822_size(msg: MaildirMessage) -> str:
         """Get message size in bytes"""
-        return str(len(str(msg).encode('utf-8')))
+        return str(len(Helpers.get_message_bytes(msg)))
 
     @staticmethod
-    def get_rfc822(msg: MaildirMessage) -> str:
-        """Get complete RFC822 message as literal string"""
-        message_content = msg.as_string(unixfrom=False)
-        byte_count = len(message_content.encode('utf-8'))
-        return f'{{{byte_count}}}\r\n{message_content}'
+    def get_rfc822(msg: MaildirMessage) -> List[bytes]:
+        """Get complete RFC822 message as a bytes literal"""
+        return Helpers.format_literal(Helpers.get_message_bytes(msg))
 
     @staticmethod
-    def get_rfc822_header(msg: MaildirMessage) -> str:
+    def get_rfc822_header(msg: MaildirMessage) -> List[bytes]:
         """Get message headers as literal string"""
-        headers = Helpers.get_message_headers(msg)
-        byte_count = len(headers.encode('utf-8'))
-        return f'{{{byte_count}}}\r\n{headers}'
+        return Helpers.format_text_literal(Helpers.get_message_headers(msg))
 
     @staticmethod
-    def get_rfc822_text(msg: MaildirMessage) -> str:
+    def get_rfc822_text(msg: MaildirMessage) -> List[bytes]:
         """Get message body as literal string"""
-        body = Helpers.get_message_body(msg)
-        byte_count = len(body.encode('utf-8'))
-        return f'{{{byte_count}}}\r\n{body}'
+        return Helpers.format_text_literal(Helpers.get_message_body(msg))
 
     @staticmethod
     def get_envelope(msg: MaildirMessage) -> str:
         """Get ENVELOPE data as structured string"""
-        envelope_data = {
-            'date': msg.get('Date'),
-            'subject': msg.get('Subject'),
-            'from': msg.get('From'),
-            'sender': msg.get('Sender'),
-            'reply_to': msg.get('Reply-To'),
-            'to': msg.get('To'),
-            'cc': msg.get('Cc'),
-            'bcc': msg.get('Bcc'),
-            'in_reply_to': msg.get('In-Reply-To'),
-            'message_id': msg.get('Message-ID')
-        }
-        
-        fields: List[str] = []
-        for field_name in ['date', 'subject', 'from', 'sender', 'reply_to', 'to', 'cc', 'bcc', 'in_reply_to', 'message_id']:
-            value = envelope_data.get(field_name)
-            if field_name in ['from', 'sender', 'reply_to', 'to', 'cc', 'bcc']:
-                fields.append(Helpers.format_address_field(value))
-            elif value:
-                fields.append(value)
-            else:
-                fields.append('NIL')
-
-        return f'({" ".join(fields)})'
+        headers = Helpers.get_header_map(msg)
+        return '(' + ' '.join([fmt(headers.get(name)) for name, fmt in _ENVELOPE_FIELDS]) + ')'
 
     @staticmethod
     def get_bodystructure(msg: MaildirMessage, extended: bool = True) -> str:
@@ -312,204 +397,162 @@ class BodyPatternHandler:
     """Handles BODY pattern expressions in FETCH commands as defined in RFC 3501"""
     
     @staticmethod
-    def handle_body_section(msg: MaildirMessage, item: str) -> Optional[str]:
+    def handle_body_section(msg: MaildirMessage, item: str, item_upper: str) -> Optional[List[bytes]]:
         """Handle BODY[section] requests"""
-        match = re.match(r'^BODY\[(.*)\]$', item, re.IGNORECASE)
-        if not match:
-            return None
-        
-        section = match.group(1)
-        
-        if section == '':
-            # BODY[] - full message
-            content = str(msg)
-            return f'{content}'
-        elif re.match(r'^HEADER\.FIELDS\.NOT', section, re.IGNORECASE):
-            # BODY[HEADER.FIELDS.NOT (...)]
-            return BodyPatternHandler._extract_header_fields_not(msg, item, section)
-        elif re.match(r'^HEADER\.FIELDS', section, re.IGNORECASE):
-            # BODY[HEADER.FIELDS (...)]
-            return BodyPatternHandler._extract_header_fields(msg, item, section)
-        elif section.upper() == 'HEADER':
-            # BODY[HEADER] - just headers
-            headers = Helpers.get_message_headers(msg)
-            return f'{headers}'
-        elif section.upper() == 'TEXT':
-            # BODY[TEXT] - just body content
-            body = Helpers.get_message_body(msg)
-            return f'{body}'
-        
-        # Skip unimplemented section types
-        return None
+        # item_upper is the already uppercased item, known to be BODY[...]
+        return BodyPatternHandler._handle_section(msg, item, item[5:-1], item_upper[5:-1])
     
     @staticmethod
-    def handle_body_peek_section(msg: MaildirMessage, item: str) -> Optional[str]:
+    def handle_body_peek_section(msg: MaildirMessage, item: str, item_upper: str) -> Optional[List[bytes]]:
         """Handle BODY.PEEK[section] requests (doesn't mark as read)"""
-        match = re.match(r'^BODY\.PEEK\[(.*)\]$', item, re.IGNORECASE)
-        if not match:
-            return None
-        
-        section = match.group(1)
-        
-        if section == '':
-            # BODY.PEEK[] - full message
-            content = str(msg)
-            return f'{item} "{content}"'
-        elif re.match(r'^HEADER\.FIELDS\.NOT', section, re.IGNORECASE):
-            # BODY.PEEK[HEADER.FIELDS.NOT (...)]
-            return BodyPatternHandler._extract_header_fields_not(msg, item, section, is_peek=True)
-        elif re.match(r'^HEADER\.FIELDS', section, re.IGNORECASE):
-            # BODY.PEEK[HEADER.FIELDS (...)]
-            return BodyPatternHandler._extract_header_fields(msg, item, section, is_peek=True)
-        elif section.upper() == 'HEADER':
-            # BODY.PEEK[HEADER] - just headers
-            headers = Helpers.get_message_headers(msg)
-            return f'{item} "{headers}"'
-        elif section.upper() == 'TEXT':
-            # BODY.PEEK[TEXT] - just body content
-            body = Helpers.get_message_body(msg)
-            return f'{item} "{body}"'
+        # item_upper is the already uppercased item, known to be BODY.PEEK[...]
+        return BodyPatternHandler._handle_section(msg, item, item[10:-1], item_upper[10:-1], is_peek=True)
+
+    @staticmethod
+    def _handle_section(msg: MaildirMessage, item: str, section: str, section_upper: str,
+                        is_peek: bool = False) -> Optional[List[bytes]]:
+        """Produce the literal for a BODY section; both BODY and BODY.PEEK return the same data"""
+        # '', HEADER and TEXT are fixed names; only HEADER.FIELDS carries arguments
+        handler = _SECTION_GETTERS.get(section_upper)
+        if handler is not None:
+            return handler(msg)
+        elif section_upper.startswith('HEADER.FIELDS.NOT'):
+            # BODY[HEADER.FIELDS.NOT (...)]
+            return BodyPatternHandler._extract_header_fields_not(msg, item, section, is_peek)
+        elif section_upper.startswith('HEADER.FIELDS'):
+            # BODY[HEADER.FIELDS (...)]
+            return BodyPatternHandler._extract_header_fields(msg, item, section, is_peek)
         
         # Skip unimplemented section types
         return None
     
     @staticmethod
-    def _extract_header_fields(msg: MaildirMessage, item: str, section: str, is_peek: bool = False) -> Optional[str]:
+    def _extract_header_fields(msg: MaildirMessage, item: str, section: str, is_peek: bool = False) -> Optional[List[bytes]]:
         """Extract specific header fields from message"""
         # Parse the header fields being requested - preserve original case
-        field_match = re.match(r'HEADER\.FIELDS\s+\((.*?)\)', section, re.IGNORECASE)
+        field_match = _HEADER_FIELDS_LIST_RE.match(section)
         if not field_match:
             return None
         
-        # Get the list of requested header field names with original case
-        requested_fields = [f.strip() for f in field_match.group(1).split()]
+        # Get the requested header field names (case-insensitive comparison)
+        requested_fields = {f.strip().lower() for f in field_match.group(1).split()}
         
-        # Build the header response, including only requested fields
-        headers = ""
-        # Create a case-insensitive lookup dictionary that preserves original field names
-        header_map = {name.lower(): (name, value) for name, value in msg.items()}
-        
-        for field in requested_fields:
-            field_lower = field.lower()
-            # Check if this field exists in message headers (case-insensitive)
-            if field_lower in header_map:
-                # Use the original header name from the message
-                orig_name, value = header_map[field_lower]
-                headers += f"{orig_name}: {value}\r\n"
+        # Emit every matching header line in message order, with the message's own header names
+        headers = "".join([f"{name}: {value}\r\n" for name, value in msg.items()
+                           if name.lower() in requested_fields])
         
         # Return as literal string with byte count
-        byte_count = len(headers.encode('utf-8'))
-        return f'{{{byte_count}}}\r\n{headers}'
+        return Helpers.format_text_literal(headers)
 
     @staticmethod
-    def _extract_header_fields_not(msg: MaildirMessage, item: str, section: str, is_peek: bool = False) -> Optional[str]:
+    def _extract_header_fields_not(msg: MaildirMessage, item: str, section: str, is_peek: bool = False) -> Optional[List[bytes]]:
         """Extract all header fields except those specified"""
         # Parse the header fields to exclude
-        field_match = re.match(r'HEADER\.FIELDS\.NOT\s+\((.*?)\)', section, re.IGNORECASE)
+        field_match = _HEADER_FIELDS_NOT_LIST_RE.match(section)
         if not field_match:
             return None
         
         # Get the list of excluded header field names (convert to lowercase for case-insensitive comparison)
-        excluded_fields = [f.strip().lower() for f in field_match.group(1).split()]
+        excluded_fields = {f.strip().lower() for f in field_match.group(1).split()}
         
         # Build the header response, excluding specified fields
-        headers = ""
-        for name, value in msg.items():
-            if name.lower() not in excluded_fields:
-                headers += f"{name}: {value}\r\n"
+        headers = "".join([f"{name}: {value}\r\n" for name, value in msg.items()
+                           if name.lower() not in excluded_fields])
         
         # Return as literal string with byte count
-        byte_count = len(headers.encode('utf-8'))
-        return f'{{{byte_count}}}\r\n{headers}'
+        return Helpers.format_text_literal(headers)
+
+# BODY sections with no arguments. HEADER is built from msg.items() without touching the body.
+_SECTION_GETTERS: Mapping[str, Callable[[MaildirMessage], List[bytes]]] = MappingProxyType({
+    '': lambda msg: Helpers.format_literal(Helpers.get_message_bytes(msg)),
+    'HEADER': lambda msg: Helpers.format_text_literal(Helpers.get_message_headers(msg)),
+    'TEXT': lambda msg: Helpers.format_text_literal(Helpers.get_message_body(msg)),
+})
 
 class Fetcher:
     """Main class for handling IMAP FETCH commands"""
     
-    def __init__(self):
-        # Pattern handlers for BODY expressions (only include fully implemented ones)
-        self.PATTERN_HANDLERS = [
-            (r'^BODY\[.*\]$', BodyPatternHandler.handle_body_section),
-            (r'^BODY\.PEEK\[.*\]$', BodyPatternHandler.handle_body_peek_section),
-        ]
-        
-        # Data getters for FETCH items (only include fully implemented ones)
-        self.DATA_GETTERS: Dict[str, Callable[[MaildirMessage], str]] = {
-            'FLAGS': DataGetters.get_flags,
-            'INTERNALDATE': DataGetters.get_internal_date,
-            'RFC822.SIZE': DataGetters.get_rfc822_size,
-            'RFC822': DataGetters.get_rfc822,
-            'RFC822.HEADER': DataGetters.get_rfc822_header, 
-            'RFC822.TEXT': DataGetters.get_rfc822_text,
-            'ENVELOPE': DataGetters.get_envelope,
-            'BODY': DataGetters.get_body,
-            'BODYSTRUCTURE': DataGetters.get_bodystructure,
-            # Header fields with proper implementations
-            'FROM': DataGetters.get_header_value('From', 'testuser@enerturk.com'),
-            'TO': DataGetters.get_header_value('To', 'testuser@enerturk.com'),
-            'CC': DataGetters.get_header_value('Cc', ''),
-            'SUBJECT': DataGetters.get_header_value('Subject', 'Test Email'),
-            'DATE': DataGetters.get_header_value('Date', 'Mon, 1 Jan 2024 12:00:00 +0000'),
-            'MESSAGE-ID': DataGetters.get_header_value('Message-ID', '<test@enerturk.com>'),
-            'REFERENCES': DataGetters.get_header_value('References', ''),
-            'IN-REPLY-TO': DataGetters.get_header_value('In-Reply-To', ''),
-            'CONTENT-TYPE': DataGetters.get_header_value('Content-Type', 'text/plain'),
-            'REPLY-TO': DataGetters.get_header_value('Reply-To', ''),
-        }
-
-    def parse_fetch_items(self, item_names: str) -> List[str]:
+    # Data getters for FETCH items (only include fully implemented ones); built once at import
+    DATA_GETTERS: Mapping[str, Callable[[MaildirMessage], Union[str, List[bytes]]]] = MappingProxyType({
+        'FLAGS': DataGetters.get_flags,
+        'INTERNALDATE': DataGetters.get_internal_date,
+        'RFC822.SIZE': DataGetters.get_rfc822_size,
+        'RFC822': DataGetters.get_rfc822,
+        'RFC822.HEADER': DataGetters.get_rfc822_header, 
+        'RFC822.TEXT': DataGetters.get_rfc822_text,
+        'ENVELOPE': DataGetters.get_envelope,
+        'BODY': DataGetters.get_body,
+        'BODYSTRUCTURE': DataGetters.get_bodystructure,
+        # Header fields with proper implementations
+        'FROM': DataGetters.get_header_value('From', 'testuser@enerturk.com'),
+        'TO': DataGetters.get_header_value('To', 'testuser@enerturk.com'),
+        'CC': DataGetters.get_header_value('Cc', ''),
+        'SUBJECT': DataGetters.get_header_value('Subject', 'Test Email'),
+        'DATE': DataGetters.get_header_value('Date', 'Mon, 1 Jan 2024 12:00:00 +0000'),
+        'MESSAGE-ID': DataGetters.get_header_value('Message-ID', '<test@enerturk.com>'),
+        'REFERENCES': DataGetters.get_header_value('References', ''),
+        'IN-REPLY-TO': DataGetters.get_header_value('In-Reply-To', ''),
+        'CONTENT-TYPE': DataGetters.get_header_value('Content-Type', 'text/plain'),
+        'REPLY-TO': DataGetters.get_header_value('Reply-To', ''),
+    })
+
+    @staticmethod
+    def parse_fetch_items(item_names: str) -> List[str]:
         """Parse FETCH items, handling bracketed expressions correctly"""
         if item_names.startswith('(') and item_names.endswith(')'):
             item_names = item_names[1:-1]
         
-        items: List[str] = []
-        current_item = ""
-        bracket_depth = 0
-        paren_depth = 0
-        in_quotes = False
-        
-        for char in item_names:
-            if char == '"' and not in_quotes:
-                in_quotes = True
-            elif char == '"' and in_quotes:
-                in_quotes = False
-            elif not in_quotes:
-                if char == '[':
-                    bracket_depth += 1
-                elif char == ']':
-                    bracket_depth -= 1
-                elif char == '(':
-                    paren_depth += 1
-                elif char == ')':
-                    paren_depth -= 1
-                elif char == ' ' and bracket_depth == 0 and paren_depth == 0:
-                    if current_item.strip():
-                        items.append(current_item.strip())
-                        current_item = ""
+        return _FETCH_ITEM_RE.findall(item_names)
+
+    def handle_fetch_items(self, items: Sequence[str], msg: MaildirMessage, uid: Optional[int] = None,
+                           items_upper: Optional[Sequence[str]] = None) -> List[Union[str, List[bytes]]]:
+        """Handle every requested FETCH data item for one message, skipping unimplemented or failing ones"""
+        # Callers fetching many messages pass the upper-cased names they computed once
+        if items_upper is None:
+            items_upper = [item.upper() for item in items]
+        results: List[Union[str, List[bytes]]] = []
+        for item, item_upper in zip(items, items_upper):
+            try:
+                if uid is not None and item_upper == 'UID':
+                    results.append(f'{item} {uid}')
                     continue
-            
-            current_item += char
-        
-        if current_item.strip():
-            items.append(current_item.strip())
-        
-        return items
+                result = self.handle_fetch_item(item, msg, item_upper)
+                if result:  # Only add if the item is implemented
+                    results.append(result)
+            except Exception as e:
+                logging.warning(f"Error handling fetch item {item}: {e}")
+        return results
+
+    def handle_fetch_item(self, item: str, msg: MaildirMessage,
+                          item_upper: Optional[str] = None) -> Optional[Union[str, List[bytes]]]:
+        """Handle a FETCH data item and return formatted response if implemented.
 
-    def handle_fetch_item(self, item: str, msg: MaildirMessage) -> Optional[str]:
-        """Handle a FETCH data item and return formatted response string if implemented"""
-        item_upper = item.upper()
+        Literal items come back as bytes chunks so the message is never decoded into a str or copied.
+        """
+        if item_upper is None:
+            item_upper = item.upper()
 
-        # Try pattern handlers first (for BODY expressions)
-        for pattern, handler in self.PATTERN_HANDLERS:
-            if re.match(pattern, item_upper):
-                return f'{item} {handler(msg, item)}'
+        # BODY expressions differ only by literal prefix; partial <n.n> forms end in '>' and are not implemented
+        if item_upper.endswith(']'):
+            if item_upper.startswith('BODY['):
+                return self._format_item(item, BodyPatternHandler.handle_body_section(msg, item, item_upper))
+            if item_upper.startswith('BODY.PEEK['):
+                return self._format_item(item, BodyPatternHandler.handle_body_peek_section(msg, item, item_upper))
 
         # Check existing handlers in DATA_GETTERS
         if item_upper in self.DATA_GETTERS:
             handler = self.DATA_GETTERS[item_upper]
             if callable(handler):
-                return f'{item} {handler(msg)}'
+                return self._format_item(item, handler(msg))
             else:
                 return f'{item} {handler}'
 
         # Skip unimplemented items
-        return None
\ No newline at end of file
+        return None
+
+    @staticmethod
+    def _format_item(item: str, value: Optional[Union[str, List[bytes]]]) -> Union[str, List[bytes]]:
+        """Prefix a data item's value with its name; for literals only the short prefix chunk is rebuilt"""
+        if isinstance(value, list):
+            return [item.encode('ascii') + b' ' + value[0], *value[1:]]
+        return f'{item} {value}'
\ No newline at end of file
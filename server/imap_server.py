@@ -2,81 +2,198 @@ import logging
 import os
 import asyncio
 import base64
+import re
+import socket
 import ssl
-import shlex
-from typing import List, Tuple, Optional, Union
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Sequence, Set, Tuple, Optional, Union
 from server.storage_manager import MaildirWrapper
-from server.imap_fetcher import Fetcher
+from server.imap_fetcher import Fetcher, Helpers
 from mailbox import MaildirMessage
 from server.authenticator import LDAPAuthenticator
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Longest command or credentials line buffered per connection; pass as start_server's limit
+MAX_LINE_LENGTH = 64 * 1024
+
+# Folder wrappers kept open between commands; each holds a message cache and its user's UID mapping
+MAX_POOLED_MAILBOXES = 128
+
+# Held reply bytes at which a pipelined batch is sent early, so a run of large FETCHes is never all in memory
+MAX_PENDING_OUTPUT = 256 * 1024
+
+# Session state a command requires, checked once before dispatch
+NEED_NONE = 0
+NEED_AUTH = 1
+NEED_FOLDER = 2
+
+# Untagged lines that never vary
+_GREETING = b"* OK Simple IMAP Server Ready\r\n"
+_CONTINUATION = b"+\r\n"
+_LITERAL_CONTINUATION = b"+ Ready for literal data\r\n"
+_NOT_ASCII_LINE = b"* BAD Command line is not valid ASCII\r\n"
+_BAD_FORMAT_LINE = b"* BAD Invalid command format\r\n"
+_LINE_TOO_LONG = b"* BAD Command line too long\r\n"
+_SERVER_ERROR_BYE = b"* BYE Server error, closing connection\r\n"
+
+# Fixed responses, formatted with the tag (and any other values) as bytes
+_CAPABILITY_RESPONSE = b"* CAPABILITY IMAP4rev1 AUTH=PLAIN LOGINDISABLED STARTTLS\r\n%b OK CAPABILITY completed\r\n"
+_NOOP_RESPONSE = b"%b OK NOOP completed\r\n"
+_CLOSE_RESPONSE = b"%b OK CLOSE completed, now in authenticated state\r\n"
+_LOGOUT_RESPONSE = b"* BYE IMAP4rev1 Server logging out\r\n%b OK LOGOUT completed\r\n"
+_NOT_AUTHENTICATED_RESPONSE = b"%b NO Not authenticated\r\n"
+_NO_FOLDER_RESPONSE = b"%b NO No folder selected\r\n"
+_UNKNOWN_COMMAND_RESPONSE = b"%b BAD Command '%b' not recognized\r\n"
+_BAD_FORMAT_RESPONSE = b"%b BAD Invalid %b command format\r\n"
+_COMPLETED_RESPONSE = b"%b OK %b completed\r\n"
+_NO_MESSAGES_RESPONSE = b"%b OK %b completed (no messages)\r\n"
+_FETCH_ERROR_RESPONSE = b"%b BAD Error processing %b command\r\n"
+_BAD_FETCH_ITEMS_RESPONSE = b"%b BAD Invalid fetch items\r\n"
+_NO_MAILBOX_RESPONSE = b"%b NO Mailbox does not exist\r\n"
+_TLS_ACTIVE_RESPONSE = b"%b BAD TLS already active\r\n"
+_TLS_AFTER_AUTH_RESPONSE = b"%b BAD Cannot start TLS after authentication\r\n"
+_BEGIN_TLS_RESPONSE = b"%b OK Begin TLS negotiation now\r\n"
+_ALREADY_AUTHENTICATED_RESPONSE = b"%b NO Already authenticated\r\n"
+_UNSUPPORTED_MECHANISM_RESPONSE = b"%b NO Unsupported authentication mechanism\r\n"
+_INCOMPLETE_CREDENTIALS_RESPONSE = b"%b BAD Incomplete credentials\r\n"
+_BAD_CREDENTIALS_FORMAT_RESPONSE = b"%b BAD Invalid PLAIN credentials format\r\n"
+_AUTHENTICATED_RESPONSE = b"%b OK AUTHENTICATE completed\r\n"
+_INVALID_CREDENTIALS_RESPONSE = b"%b NO Invalid credentials\r\n"
+_INTERNAL_ERROR_RESPONSE = b"%b BAD Internal server error\r\n"
+_BAD_RESPONSE = b"%b BAD %b\r\n"
+_UNKNOWN_UID_COMMAND_RESPONSE = b"%b BAD UID subcommand '%b' not recognized\r\n"
+_FLAGS_LINE = b"* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n"
+_PERMANENTFLAGS_LINE = b"* OK [PERMANENTFLAGS (\\Deleted \\Seen)] Limited\r\n"
+
+# A line ending in {N} (after our continuation) or {N+} (RFC 7888, without one) continues with
+# an N-octet literal and then the rest of the line
+_LITERAL_RE = re.compile(rb'\{(\d+)(\+?)\}\r\n\Z')
+# Literals are kept out of the command line; their {N} announcement stays behind as a marker argument
+_LITERAL_MARKER_RE = re.compile(r'\{\d+\+?\}')
+
+# One argument: a quoted string with backslash escapes (group 1) or a bare atom (group 2)
+_ARG_RE = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|([^\s"]+))')
+_QUOTED_ESCAPE_RE = re.compile(r'\\(.)')
+
+def _split_args(args: str, literals: Sequence[str] = ()) -> Optional[List[str]]:
+    """Split command arguments into strings, or None if they are malformed (e.g. an unterminated quote).
+    Literal markers are replaced, in order, by the command's literals."""
+    # Without a quoted string the arguments are plain atoms, which str.split separates in one C call
+    if '"' not in args and not literals:
+        return args.split()
+    remaining_literals = iter(literals)
+    parts = []
+    pos = 0
+    end = len(args.rstrip())
+    while pos < end:
+        match = _ARG_RE.match(args, pos)
+        if match is None:
+            return None
+        quoted = match.group(1)
+        if quoted is None:
+            atom = match.group(2)
+            if literals and _LITERAL_MARKER_RE.fullmatch(atom):
+                atom = next(remaining_literals, atom)
+            parts.append(atom)
+        elif '\\' in quoted:
+            parts.append(_QUOTED_ESCAPE_RE.sub(r'\1', quoted))
+        else:
+            parts.append(quoted)
+        pos = match.end()
+    return parts
+
+# Items that can be answered from the key -> filename index alone, since Maildir keeps flags in the name
+INDEX_FETCH_ITEMS = frozenset({'UID', 'FLAGS'})
+# Items that can be answered from the raw message file without parsing it
+RAW_FETCH_ITEMS = INDEX_FETCH_ITEMS | {'RFC822', 'RFC822.SIZE'}
+# Items that serve the whole message; every path takes them from the file bytes so a message has one size
+WHOLE_MESSAGE_ITEMS = frozenset({'RFC822', 'RFC822.SIZE', 'BODY[]', 'BODY.PEEK[]'})
+
+# Macro expansions
+FETCH_MACROS = {
+    'ALL': ('FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE'),
+    'FAST': ('FLAGS', 'INTERNALDATE', 'RFC822.SIZE'),
+    'FULL': ('FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE', 'BODY'),
+}
+
+@lru_cache(maxsize=256)
+def _parse_fetch_items(item_names: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], bool, bool, bool]:
+    """Parse and expand a FETCH item list into (items, upper-cased items), and tell whether
+    the filename index or the raw file alone can answer it and whether it needs the file bytes"""
+    # Clients send the same few item lists over and over, so the result is cached (hence the tuples);
+    # the upper-cased names are reused for every message instead of recomputed per item
+    items = Fetcher.parse_fetch_items(item_names)
+    if len(items) == 1 and items[0].upper() in FETCH_MACROS:
+        items = FETCH_MACROS[items[0].upper()]
+    upper_items = tuple(item.upper() for item in items)
+    return (tuple(items), upper_items,
+            all(item in INDEX_FETCH_ITEMS for item in upper_items),
+            all(item in RAW_FETCH_ITEMS for item in upper_items),
+            any(item in WHOLE_MESSAGE_ITEMS for item in upper_items))
+
 class IMAPContext:
     """Context object to hold IMAP session state"""
     def __init__(self, base_dir: str):
         self.base_dir = base_dir
         self.authenticated_user: Optional[str] = None
         self.selected_folder: Optional[str] = None
+        # Wrapper opened by SELECT/EXAMINE, reused by every command until CLOSE
+        self.selected_mailbox: Optional[MaildirWrapper] = None
         self.read_only: bool = True
         self.tls_active: bool = False
+        # Literals sent with the current command, or why they were refused
+        self.literals: List[str] = []
+        self.literal_error: Optional[bytes] = None
+        # Replies held back while more pipelined commands are already buffered
+        self.pending_output: List[bytes] = []
+        self.pending_size = 0
 
 class FetchProcessor:
     """Handles FETCH command processing"""
-    
+
     def __init__(self):
         self.fetcher = Fetcher()
     
-    async def handle_seq_fetch(self, tag: str, sequences: str, item_names: str, context: IMAPContext) -> str:
+    async def handle_seq_fetch(self, tag: str, sequences: str, item_names: str, context: IMAPContext) -> Union[str, bytes, List[bytes]]:
         """Handle sequence-based FETCH command"""
-        mailbox = self._get_mailbox(context)
-        message_pairs = await self._get_message_uid_key_pairs(mailbox)
+        mailbox = await self._get_mailbox(context)
+        message_pairs = await mailbox.get_uid_key_pairs()
         
         if not message_pairs:
-            return f"{tag} OK FETCH completed (no messages)\r\n"
+            return _NO_MESSAGES_RESPONSE % (tag.encode('ascii'), b"FETCH")
         
         try:
             seq_list = self._parse_sequence_set(sequences, len(message_pairs))
             if isinstance(seq_list, str):  # Error message
-                return f"{tag} BAD {seq_list}\r\n"
+                return _BAD_RESPONSE % (tag.encode('ascii'), seq_list.encode('ascii'))
                 
             fetch_targets = self._get_targets_from_seq_list(seq_list, message_pairs)
             return await self._handle_fetch_command(tag, fetch_targets, item_names, mailbox, False)
         except Exception as e:
             logging.error(f"Error processing sequence FETCH: {e}")
-            return f"{tag} BAD Error processing FETCH command\r\n"
+            return _FETCH_ERROR_RESPONSE % (tag.encode('ascii'), b"FETCH")
     
-    async def handle_uid_fetch(self, tag: str, uids: str, item_names: str, context: IMAPContext) -> str:
+    async def handle_uid_fetch(self, tag: str, uids: str, item_names: str, context: IMAPContext) -> Union[str, bytes, List[bytes]]:
         """Handle UID-based FETCH command"""
-        mailbox = self._get_mailbox(context)
-        message_pairs = await self._get_message_uid_key_pairs(mailbox)
+        mailbox = await self._get_mailbox(context)
+        message_pairs = await mailbox.get_uid_key_pairs()
         
         if not message_pairs:
-            return f"{tag} OK UID FETCH completed (no messages)\r\n"
+            return _NO_MESSAGES_RESPONSE % (tag.encode('ascii'), b"UID FETCH")
         
         try:
-            uid_list = await self._parse_uid_set(uids, mailbox)
-            if isinstance(uid_list, str):  # Error message
-                return f"{tag} BAD {uid_list}\r\n"
+            fetch_targets = await self._get_targets_from_uid_set(uids, mailbox, message_pairs)
+            if isinstance(fetch_targets, str):  # Error message
+                return _BAD_RESPONSE % (tag.encode('ascii'), fetch_targets.encode('ascii'))
                 
-            fetch_targets = await self._get_targets_from_uid_list(uid_list, mailbox, message_pairs)
             return await self._handle_fetch_command(tag, fetch_targets, item_names, mailbox, True)
         except Exception as e:
             logging.error(f"Error processing UID FETCH: {e}")
-            return f"{tag} BAD Error processing UID FETCH command\r\n"
-    
-    async def _get_message_uid_key_pairs(self, mailbox: MaildirWrapper) -> List[Tuple[int, str]]:
-        """Get sorted list of (uid, key) pairs for all messages in mailbox"""
-        message_keys = mailbox.get_keys_safe()
-        message_pairs: List[Tuple[int, str]] = []
-
-        for key in message_keys:
-            uid = await mailbox.get_uid_from_key(key)
-            if uid is not None:
-                message_pairs.append((uid, key))
-        
-        return sorted(message_pairs, key=lambda pair: pair[0])
+            return _FETCH_ERROR_RESPONSE % (tag.encode('ascii'), b"UID FETCH")
     
     def _parse_sequence_set(self, sequences: str, max_seq: int) -> Union[List[int], str]:
         """Parse sequence set into list of sequence numbers"""
@@ -111,11 +228,25 @@ class FetchProcessor:
         
         return sorted(set(seq_list))
     
-    async def _parse_uid_set(self, uids: str, mailbox: MaildirWrapper) -> Union[List[int], str]:
-        """Parse UID set into list of UIDs"""
-        uid_list: List[int] = []
+    def _get_targets_from_seq_list(self, seq_list: List[int], message_pairs: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
+        """Convert sequence numbers to fetch targets"""
+        fetch_targets: List[Tuple[int, int, str]] = []
+        
+        for seq in seq_list:
+            if 1 <= seq <= len(message_pairs):
+                index = seq - 1
+                uid, key = message_pairs[index]
+                fetch_targets.append((seq, uid, key))
+        
+        return fetch_targets
+    
+    async def _get_targets_from_uid_set(self, uids: str, mailbox: MaildirWrapper,
+                                        message_pairs: List[Tuple[int, str]]) -> Union[List[Tuple[int, int, str]], str]:
+        """Resolve a UID set to fetch targets, or an error message if it is malformed"""
         max_uid = await mailbox.get_uidnext() - 1
-        has_messages = len(mailbox.get_keys_safe()) > 0
+        # Indexes into message_pairs, which is in UID order; ranges are cut out of it by
+        # bisection, so "1:4294967295" costs no more than the messages it actually matches
+        indexes: Set[int] = set()
         
         try:
             for uid_part in uids.split(','):
@@ -124,140 +255,151 @@ class FetchProcessor:
                 if ':' in uid_part:
                     # Handle range (e.g., "1:5", "1:*")
                     start_str, end_str = uid_part.split(':')
+                    start_uid = max_uid if start_str == '*' else int(start_str)
+                    end_uid = max_uid if end_str == '*' else int(end_str)
                     
-                    # Handle special case for "*"
-                    if start_str == "*":
-                        start_uid = max_uid if has_messages else 0
-                    else:
-                        start_uid = int(start_str)
-                        
-                    if end_str == "*":
-                        end_uid = max_uid
-                    else:
-                        end_uid = int(end_str)
-                    
-                    # For UID ranges, we include UIDs that may not exist
                     if start_uid <= end_uid:
-                        uid_list.extend(range(start_uid, end_uid + 1))
-                elif uid_part == '*':
-                    uid_list.append(max_uid if has_messages else 0)
+                        indexes.update(range(bisect_left(message_pairs, (start_uid,)),
+                                             bisect_left(message_pairs, (end_uid + 1,))))
                 else:
-                    uid_list.append(int(uid_part))
+                    uid = max_uid if uid_part == '*' else int(uid_part)
+                    index = bisect_left(message_pairs, (uid,))
+                    if index < len(message_pairs) and message_pairs[index][0] == uid:
+                        indexes.add(index)
         except ValueError:
             return "Invalid UID set"
         
-        return sorted(set(uid_list))
-    
-    def _get_targets_from_seq_list(self, seq_list: List[int], message_pairs: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
-        """Convert sequence numbers to fetch targets"""
-        fetch_targets: List[Tuple[int, int, str]] = []
-        
-        for seq in seq_list:
-            if 1 <= seq <= len(message_pairs):
-                index = seq - 1
-                uid, key = message_pairs[index]
-                fetch_targets.append((seq, uid, key))
-        
-        return fetch_targets
-    
-    async def _get_targets_from_uid_list(self, uid_list: List[int], mailbox: MaildirWrapper, 
-                                        message_pairs: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
-        """Convert UIDs to fetch targets"""
-        # Create mapping from UID to sequence number
-        uid_to_seq = {uid: seq for seq, (uid, _) in enumerate(message_pairs, 1)}
-
-        fetch_targets: List[Tuple[int, int, str]] = []
-        for uid in uid_list:
-            key = await mailbox.get_key_from_uid(uid)
-            if key is not None:
-                seq_num = uid_to_seq.get(uid, -1)
-                fetch_targets.append((seq_num, uid, key))
-        
-        return fetch_targets
+        return [(index + 1, *message_pairs[index]) for index in sorted(indexes)]
     
     async def _handle_fetch_command(self, tag: str, fetch_targets: List[Tuple[int, int, str]], 
-                                  item_names: str, mailbox: MaildirWrapper, is_uid_fetch: bool) -> str:
+                                  item_names: str, mailbox: MaildirWrapper, is_uid_fetch: bool) -> Union[str, bytes, List[bytes]]:
         """Handle complete FETCH processing"""
         try:
-            items = self.fetcher.parse_fetch_items(item_names)
+            items, upper_items, index_only, raw_only, whole_message = _parse_fetch_items(item_names)
         except Exception as e:
             logging.error(f"Failed to parse fetch items: {e}")
-            return f"{tag} BAD Invalid fetch items\r\n"
-        
-        # Macro expansions
-        MACROS = {
-            'ALL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE'],
-            'FAST': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE'],
-            'FULL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE', 'BODY']
-        }
+            return _BAD_FETCH_ITEMS_RESPONSE % tag.encode('ascii')
         
-        if len(items) == 1 and items[0].upper() in MACROS:
-            items = MACROS[items[0].upper()]
-        
-        command_name = "UID FETCH" if is_uid_fetch else "FETCH"
-        response = ""
+        command_name = b"UID FETCH" if is_uid_fetch else b"FETCH"
+        # UID FETCH replies always carry the UID (IMAP requirement), asked for or not
+        add_uid = is_uid_fetch and 'UID' not in upper_items
+        # Message data stays bytes end to end and is never joined here; the chunks go to writelines
+        responses: List[bytes] = []
         
         for seq_num, uid, key in fetch_targets:
             try:
+                if index_only:
+                    flags = mailbox.get_indexed_flags(key)
+                    if flags is not None:
+                        responses.extend(self._handle_raw_fetch_message(seq_num, uid, None, flags, items, upper_items, add_uid))
+                        continue
+                if raw_only:
+                    raw = await mailbox.load_raw(key)
+                    if raw is not None:
+                        # load_raw has located the file, so its flags are indexed now
+                        flags = mailbox.get_indexed_flags(key)
+                        responses.extend(self._handle_raw_fetch_message(seq_num, uid, raw, flags, items, upper_items, add_uid))
+                    continue
                 message = mailbox.get_message_safe(key)
                 if message:
-                    fetch_response = await self._handle_fetch_message(
-                        seq_num, uid, key, message, items, is_uid_fetch)
-                    if fetch_response:
-                        response += fetch_response
+                    if whole_message and not Helpers.has_message_bytes(message):
+                        raw = await mailbox.load_raw(key)
+                        if raw is not None:
+                            Helpers.set_message_bytes(message, raw)
+                    responses.extend(await self._handle_fetch_message(
+                        seq_num, uid, key, message, items, upper_items, add_uid))
             except Exception as e:
-                logging.warning(f"Error processing {command_name} for seq={seq_num}, uid={uid}: {e}")
+                logging.warning("Error processing %s for seq=%s, uid=%s: %s", command_name.decode('ascii'), seq_num, uid, e)
                 continue
         
-        response += f"{tag} OK {command_name} completed\r\n"
-        return response
+        responses.append(_COMPLETED_RESPONSE % (tag.encode('ascii'), command_name))
+        return responses
     
     async def _handle_fetch_message(self, seq_num: int, uid: int, key: str, 
-                                  message: MaildirMessage, items: List[str], is_uid_fetch: bool) -> str:
+                                  message: MaildirMessage, items: Sequence[str], upper_items: Sequence[str],
+                                  add_uid: bool) -> List[bytes]:
         """Handle FETCH for a single message"""
-        fetch_items: List[str] = []
-        
-        for item in items:
-            try:
-                upper = item.upper()
-                if upper == 'UID':
-                    fetch_items.append(f'{item} {uid}')
-                else:
-                    result = self.fetcher.handle_fetch_item(item, message)
-                    if result:  # Only add if the item is implemented
-                        fetch_items.append(result)
-            except Exception as e:
-                logging.warning(f"Error handling fetch item {item}: {e}")
-                continue
+        fetch_items = self.fetcher.handle_fetch_items(items, message, uid, upper_items)
         
         if not fetch_items:
-            return ""
+            return []
+        
+        if add_uid:
+            fetch_items.insert(0, f'UID {uid}')
         
-        # Always include UID in UID FETCH responses (IMAP requirement)
-        if is_uid_fetch and not any(item.upper().startswith('UID ') for item in fetch_items):
+        return self._format_fetch_response(seq_num, fetch_items)
+    
+    def _handle_raw_fetch_message(self, seq_num: int, uid: int, raw: Optional[bytes],
+                                  flags: Optional[Tuple[str, bool]], items: Sequence[str], upper_items: Sequence[str],
+                                  add_uid: bool) -> List[bytes]:
+        """Handle FETCH for a single message using its indexed flags and unparsed file contents"""
+        fetch_items: List[Union[str, List[bytes]]] = []
+        
+        for item, upper in zip(items, upper_items):
+            if upper == 'UID':
+                fetch_items.append(f'{item} {uid}')
+            elif upper == 'FLAGS':
+                if flags is not None:
+                    fetch_items.append(f'{item} {Helpers.format_flags(*flags)}')
+            elif upper == 'RFC822.SIZE':
+                # The file holds the message bytes as served, so no parse or encode is needed
+                fetch_items.append(f'{item} {len(raw)}')
+            else:
+                # Literal prefix and file contents stay separate chunks so the message is never copied
+                fetch_items.append([item.encode('ascii') + b' {%d}\r\n' % len(raw), raw])
+        
+        if add_uid:
             fetch_items.insert(0, f'UID {uid}')
         
         return self._format_fetch_response(seq_num, fetch_items)
     
-    def _format_fetch_response(self, seq_num: int, fetch_items: List[str]) -> str:
-        """Format FETCH response with all data as quoted strings"""
+    def _format_fetch_response(self, seq_num: int, fetch_items: List[Union[str, List[bytes]]]) -> List[bytes]:
+        """Format FETCH response as chunks, passing literal message data through untouched"""
         if not fetch_items:
-            return ""
-            
-        return f"* {seq_num} FETCH ({' '.join(fetch_items)} )\r\n"
+            return []
+        
+        chunks = [b"* %d FETCH (" % seq_num]
+        for item in fetch_items:
+            if isinstance(item, list):
+                chunks.extend(item)
+            else:
+                chunks.append(item.encode('utf-8'))
+            chunks.append(b" ")
+        chunks.append(b")\r\n")
+        return chunks
     
-    def _get_mailbox(self, context: IMAPContext) -> MaildirWrapper:
+    async def _get_mailbox(self, context: IMAPContext) -> MaildirWrapper:
         """Get mailbox wrapper for current context"""
         if not context.authenticated_user:
             raise ValueError("Not authenticated")
+        if context.selected_mailbox is not None:
+            return context.selected_mailbox
             
         base_path = os.path.join(context.base_dir, context.authenticated_user)
         folder_name = "" if context.selected_folder == "INBOX" else context.selected_folder
         
-        return MaildirWrapper(base_path, folder_name=folder_name, create=False)
+        return await MaildirWrapper.create(base_path, folder_name=folder_name, create=False)
 
 class IMAPHandler:
     """Refactored IMAP handler with integrated command handlers"""
+
+    # Commands handled as (tag, args, context) -> response, with the session state each requires
+    COMMANDS: Dict[str, Tuple[str, int]] = {
+        "CAPABILITY": ("_handle_capability", NEED_NONE),
+        "NOOP": ("_handle_noop", NEED_NONE),
+        "SELECT": ("_handle_select", NEED_AUTH),
+        "EXAMINE": ("_handle_examine", NEED_AUTH),
+        "LIST": ("_handle_list", NEED_AUTH),
+        "LSUB": ("_handle_lsub", NEED_AUTH),
+        "STATUS": ("_handle_status", NEED_AUTH),
+        "FETCH": ("_handle_fetch", NEED_AUTH | NEED_FOLDER),
+        "UID": ("_handle_uid", NEED_AUTH | NEED_FOLDER),
+        "CLOSE": ("_handle_close", NEED_AUTH | NEED_FOLDER),
+        "LOGOUT": ("_handle_logout", NEED_NONE),
+    }
+    
+    # Commands whose handlers write to (or read from) the stream directly
+    DIRECT_WRITE_COMMANDS = {"STARTTLS", "AUTHENTICATE", "LOGIN"}
     
     def __init__(self, base_dir: str, host_name: str, ssl_context: ssl.SSLContext, auth_type: str):
         self.base_dir = base_dir
@@ -266,243 +408,378 @@ class IMAPHandler:
         self.fetch_processor = FetchProcessor()
         self.auth_type = auth_type
         self.authenticator = LDAPAuthenticator(self.auth_type)
+        # Bound once per handler so dispatch is a single dict lookup
+        self._dispatch: Dict[str, Tuple[Callable[[str, str, IMAPContext], Awaitable[Union[str, bytes, List[bytes]]]], int]] = {
+            command: (getattr(self, method_name), required)
+            for command, (method_name, required) in self.COMMANDS.items()
+        }
+        # Folders opened by SELECT/EXAMINE, STATUS and LIST, shared by every session, keyed by
+        # (user path, folder), least recently used first
+        self._mailboxes: OrderedDict[Tuple[str, str], MaildirWrapper] = OrderedDict()
+        self._mailboxes_lock = asyncio.Lock()
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle individual IMAP client connection"""
-        logging.info(f"IMAP connection from {writer.get_extra_info('peername')}")
+        logging.info("IMAP connection from %s", writer.get_extra_info('peername'))
         
         context = IMAPContext(self.base_dir)
+        self._set_nodelay(writer)
         
         try:
             await self._send_greeting(writer)
             
             while True:
-                command_line = await self._read_command(reader, writer)
+                # Replies to a pipelined batch go out in one write once no further command is waiting
+                if context.pending_output:
+                    command_line = await self._read_command_or_flush(reader, writer, context)
+                else:
+                    command_line = await self._read_command(reader, writer, context)
                 if command_line is None:
                     break
+                if not command_line.isascii():
+                    self._queue_response(context, _NOT_ASCII_LINE)
+                    continue
                 
                 tag, command, args = self._parse_command(command_line)
                 if tag is None or command is None:
-                    await self._send_response(writer, "* BAD Invalid command format\r\n")
+                    self._queue_response(context, _BAD_FORMAT_LINE)
+                    continue
+                if context.literal_error is not None:
+                    self._queue_response(context, _BAD_RESPONSE % (tag.encode('ascii'), context.literal_error))
                     continue
                 
-                response = await self._handle_command(tag, command, args, context, reader, writer)
+                if command in self.DIRECT_WRITE_COMMANDS:
+                    # These write to the stream themselves, so earlier replies must go out first
+                    await self._flush_responses(writer, context)
+                try:
+                    response = await self._handle_command(tag, command, args, context, reader, writer)
+                except ConnectionError:
+                    raise
+                except Exception:
+                    # A failing handler costs one BAD reply, not the session (and the client's reconnect + login)
+                    logging.exception("IMAP %s handler failed", command)
+                    response = _INTERNAL_ERROR_RESPONSE % tag.encode('ascii')
                 if response:
-                    await self._send_response(writer, response)
+                    self._queue_response(context, response)
+                    if context.pending_size >= MAX_PENDING_OUTPUT:
+                        await self._flush_responses(writer, context)
                 
                 if command == "LOGOUT":
                     break
+            await self._flush_responses(writer, context)
 
         except ConnectionResetError:
             logging.info("IMAP client disconnected")
         except Exception as e:
             logging.error(f"IMAP client error: {e}")
-            await self._send_error_response(writer)
+            await self._send_error_response(writer, context)
         finally:
             await self._cleanup_connection(writer)
 
+    @staticmethod
+    def _set_nodelay(writer: asyncio.StreamWriter):
+        """Disable Nagle's algorithm so short replies are not held back waiting for an ACK"""
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError as e:
+                logging.debug("Could not set TCP_NODELAY: %s", e)
+
     async def _send_greeting(self, writer: asyncio.StreamWriter):
         """Send initial greeting to client"""
-        greeting = "* OK Simple IMAP Server Ready\r\n"
-        await self._send_response(writer, greeting)
-
-    async def _read_command(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[str]:
-        """Read and decode command from client"""
-        try:
-            line = await reader.readuntil("\r\n".encode('ascii'))
-            if not line:
+        await self._send_response(writer, _GREETING)
+
+    async def _read_command_or_flush(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                     context: IMAPContext) -> Optional[bytes]:
+        """Read the next command, first sending held replies unless that command has already arrived"""
+        read = asyncio.ensure_future(self._read_command(reader, writer, context))
+        # A buffered line is returned without suspending, so one loop turn is enough to finish the read;
+        # if it is still pending the client is waiting for our replies
+        await asyncio.sleep(0)
+        if not read.done():
+            try:
+                await self._flush_responses(writer, context)
+            except BaseException:
+                read.cancel()
+                raise
+        return await read
+
+    async def _read_command(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            context: IMAPContext) -> Optional[bytes]:
+        """Read one command line from the client, left as bytes"""
+        while True:
+            try:
+                # asyncio's stream buffer does the line framing; no manual concat/split here
+                line = await reader.readuntil(b"\r\n")
+                line = await self._read_literals(reader, writer, context, line)
+            except asyncio.IncompleteReadError:
+                # Client closed the connection (possibly mid-line)
                 return None
-            command_line = line.decode('ascii')
-            logging.debug(f"IMAP << {command_line.encode('ascii')}")
-            return command_line
-        except UnicodeDecodeError:
-            await self._send_response(writer, "* BAD Command line is not valid ASCII\r\n")
-            return None
-
-    def _parse_command(self, command_line: str) -> Tuple[Optional[str], Optional[str], str]:
-        """Parse command line into tag, command, and args"""
-        parts = command_line.rstrip("\r\n").split(" ", 2)
+            except asyncio.LimitOverrunError as e:
+                self._queue_response(context, _LINE_TOO_LONG)
+                await self._flush_responses(writer, context)
+                try:
+                    await self._skip_line(reader, e.consumed)
+                except asyncio.IncompleteReadError:
+                    return None
+                continue
+            logging.debug("IMAP << %r", line)
+            return line
+
+    async def _read_literals(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             context: IMAPContext, line: bytes) -> bytes:
+        """Read the literals a line announces into context.literals, leaving their markers in the line"""
+        context.literals = []
+        context.literal_error = None
+        literal_bytes = 0
+        scan_from = 0
+        while (match := _LITERAL_RE.search(line, scan_from)) is not None:
+            size = int(match.group(1))
+            synchronizing = not match.group(2)
+            literal_bytes += size
+            if context.literal_error is None and len(line) + literal_bytes > MAX_LINE_LENGTH:
+                context.literal_error = b"Literal too large"
+            if context.literal_error is not None:
+                if synchronizing:
+                    # Without a continuation the client sends neither the literal nor the rest of the line
+                    break
+                # A non-synchronizing literal arrives regardless; drop it in pieces the limit allows
+                while size:
+                    size -= len(await reader.readexactly(min(size, MAX_LINE_LENGTH)))
+            else:
+                if synchronizing:
+                    self._queue_response(context, _LITERAL_CONTINUATION)
+                    await self._flush_responses(writer, context)
+                # The length is known, so read it exactly rather than scanning for a line end
+                literal = await reader.readexactly(size)
+                try:
+                    context.literals.append(literal.decode('utf-8'))
+                except UnicodeDecodeError:
+                    context.literal_error = b"Literal is not valid UTF-8"
+            # Keep the {N} marker (without its line end) and continue with the rest of the line,
+            # where the next literal can be announced
+            scan_from = match.end() - 2
+            line = line[:scan_from] + await reader.readuntil(b"\r\n")
+        return line
+
+    @staticmethod
+    async def _skip_line(reader: asyncio.StreamReader, consumed: int):
+        """Drop the rest of a line that overran the stream limit, never buffering more than the limit"""
+        while True:
+            # The oversized data is still buffered; drop it and keep looking for its line end
+            await reader.readexactly(consumed)
+            try:
+                await reader.readuntil(b"\r\n")
+                return
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    def _parse_command(self, command_line: bytes) -> Tuple[Optional[str], Optional[str], str]:
+        """Parse an ASCII command line into tag, command, and args"""
+        # Split and uppercase on bytes; only the pieces are decoded, never the whole line twice
+        parts = command_line.rstrip(b"\r\n").split(b" ", 2)
         if len(parts) < 2:
             return None, None, ""
         
-        tag = parts[0]
-        command = parts[1].upper()
-        args = parts[2] if len(parts) > 2 else ""
+        tag = parts[0].decode('ascii')
+        command = parts[1].upper().decode('ascii')
+        args = parts[2].decode('ascii') if len(parts) > 2 else ""
         
         return tag, command, args
 
     async def _handle_command(self, tag: str, command: str, args: str, 
-                            context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
+                            context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Union[str, bytes, List[bytes]]:
         """Route command to appropriate handler"""
-        
-        # Handle special commands that need reader/writer access
-        if command == "STARTTLS":
-            return await self._handle_starttls(tag, context, reader, writer)
-        elif command == "AUTHENTICATE":
-            return await self._handle_authenticate(tag, args, context, reader, writer)
-        elif command == "LOGIN":
-            return await self._handle_authenticate(tag, "PLAIN " + args, context, reader, writer)
-        elif command == "LOGOUT":
-            return await self._handle_logout(tag, writer)
-        
-        # Use method dispatch for other commands
-        handler_method = getattr(self, f"_handle_{command.lower()}", None)
-        if handler_method:
-            return await handler_method(tag, args, context)
-        else:
-            return f"{tag} BAD Command '{command}' not recognized\r\n"
-
-    async def _handle_capability(self, tag: str, args: str, context: IMAPContext) -> str:
-        capabilities = ["IMAP4rev1", "AUTH=PLAIN", "LOGINDISABLED", "STARTTLS"]
-        capability_str = " ".join(capabilities)
-        return f"* CAPABILITY {capability_str}\r\n{tag} OK CAPABILITY completed\r\n"
-
-    async def _handle_select(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO Not authenticated\r\n"
-        
-        lexer = shlex.split(args)
-        if len(lexer) != 1:
-            return f"{tag} BAD Invalid SELECT command format\r\n"
+        entry = self._dispatch.get(command)
+        if entry is None:
+            # Commands that need reader/writer access run once per session, so they are
+            # only tried after the table lookup misses instead of ahead of every command
+            if command == "STARTTLS":
+                return await self._handle_starttls(tag, context, reader, writer)
+            elif command == "AUTHENTICATE":
+                return await self._handle_authenticate(tag, args, context, reader, writer)
+            elif command == "LOGIN":
+                return await self._handle_authenticate(tag, "PLAIN " + args, context, reader, writer)
+            return _UNKNOWN_COMMAND_RESPONSE % (tag.encode('ascii'), command.encode('ascii'))
+        
+        handler_method, required = entry
+        state = (NEED_AUTH if context.authenticated_user else 0) | (NEED_FOLDER if context.selected_folder else 0)
+        missing = required & ~state
+        if missing & NEED_AUTH:
+            return _NOT_AUTHENTICATED_RESPONSE % tag.encode('ascii')
+        elif missing & NEED_FOLDER:
+            return _NO_FOLDER_RESPONSE % tag.encode('ascii')
+        return await handler_method(tag, args, context)
+
+    async def _handle_capability(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        return _CAPABILITY_RESPONSE % tag.encode('ascii')
+
+    async def _handle_select(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        return await self._open_mailbox(tag, args, context, read_only=False)
+
+    async def _handle_examine(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        return await self._open_mailbox(tag, args, context, read_only=True)
+
+    async def _open_mailbox(self, tag: str, args: str, context: IMAPContext, read_only: bool) -> bytes:
+        """Shared SELECT/EXAMINE; the reply names the command and access mode directly"""
+        tag_bytes = tag.encode('ascii')
+        command = b"EXAMINE" if read_only else b"SELECT"
+        lexer = _split_args(args, context.literals)
+        if lexer is None or len(lexer) != 1:
+            return _BAD_FORMAT_RESPONSE % (tag_bytes, command)
         
         mailbox_name = lexer[0]
         base_mailbox_path = os.path.join(context.base_dir, context.authenticated_user)
         
+        folder_name = "" if mailbox_name.upper() == 'INBOX' else mailbox_name
         try:
-            if mailbox_name.upper() == 'INBOX':
-                mailbox = MaildirWrapper(base_mailbox_path, create=False)
-            else:
-                mailbox = MaildirWrapper(base_mailbox_path, folder_name=mailbox_name, create=False)
+            mailbox = await self._get_shared_mailbox(base_mailbox_path, folder_name)
         except FileNotFoundError:
-            return f"{tag} NO [NONMAILBOX] Mailbox does not exist\r\n"
+            return b"%b NO [NONMAILBOX] Mailbox does not exist\r\n" % tag_bytes
 
         try:
-            exists, recent, first_unseen, uidvalidity, uidnext = await asyncio.gather(
-                mailbox.get_message_count(),
-                mailbox.get_recent_count(),
+            # One scan fills the stats cache that the gathered calls below read from
+            stats = await mailbox.get_folder_stats()
+            exists, recent = stats['exists'], stats['recent']
+            first_unseen, uidvalidity, uidnext = await asyncio.gather(
                 mailbox.get_first_unseen_seq(),
                 mailbox.get_uidvalidity(),
                 mailbox.get_uidnext()
             )
 
-            response = f"* {exists} EXISTS\r\n"
-            response += f"* {recent} RECENT\r\n"
-
+            # Collected as bytes and joined once, so the reply is written in a single call
+            chunks = [b"* %d EXISTS\r\n" % exists, b"* %d RECENT\r\n" % recent]
             if first_unseen is not None:
-                response += f"* OK [UNSEEN {first_unseen}] Message {first_unseen} is first unseen\r\n"
-
-            response += f"* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n"
-            response += f"* OK [PERMANENTFLAGS (\\Deleted \\Seen)] Limited\r\n"
-            response += f"* OK [UIDVALIDITY {uidvalidity}] UIDs valid\r\n"
-            response += f"* OK [UIDNEXT {uidnext}] Predicted next UID\r\n"
-            response += f"{tag} OK [READ-WRITE] SELECT completed\r\n"
+                chunks.append(b"* OK [UNSEEN %d] Message %d is first unseen\r\n" % (first_unseen, first_unseen))
+            chunks.append(_FLAGS_LINE)
+            chunks.append(_PERMANENTFLAGS_LINE)
+            chunks.append(b"* OK [UIDVALIDITY %d] UIDs valid\r\n" % uidvalidity)
+            chunks.append(b"* OK [UIDNEXT %d] Predicted next UID\r\n" % uidnext)
+            chunks.append(b"%b OK [%b] %b completed\r\n" % (
+                tag_bytes, b"READ-ONLY" if read_only else b"READ-WRITE", command))
             
             context.selected_folder = mailbox_name
-            context.read_only = False
+            context.selected_mailbox = mailbox
+            context.read_only = read_only
             
-            return response
+            return b"".join(chunks)
 
         except Exception as e:
-            return f"{tag} NO [SERVERFAILURE] Server error: {str(e)}\r\n"
-
-    async def _handle_examine(self, tag: str, args: str, context: IMAPContext) -> str:
-        response = await self._handle_select(tag, args, context)
-        response = response.replace("SELECT", "EXAMINE")
-        response = response.replace("[READ-WRITE]", "[READ-ONLY]")
-        context.read_only = True
-        return response
+            return b"%b NO [SERVERFAILURE] Server error: %b\r\n" % (tag_bytes, str(e).encode('ascii', 'replace'))
+
+    async def _get_shared_mailbox(self, base_path: str, folder_name: str) -> MaildirWrapper:
+        """Get the pooled wrapper for a folder, opening it on first use"""
+        key = (base_path, folder_name)
+        async with self._mailboxes_lock:
+            mailbox = self._mailboxes.get(key)
+            # A folder deleted or renamed on disk must not be served from the pool
+            if mailbox is not None and not os.path.isdir(mailbox.path):
+                del self._mailboxes[key]
+                mailbox = None
+            if mailbox is None:
+                # Sessions share it while its scans run in worker threads, so it needs the lock
+                mailbox = await MaildirWrapper.create(base_path, folder_name=folder_name, create=False,
+                                                      thread_safe=True)
+                self._mailboxes[key] = mailbox
+                if len(self._mailboxes) > MAX_POOLED_MAILBOXES:
+                    # Sessions that selected the evicted folder keep their reference; its
+                    # pending mapping write still runs from its own debounce task
+                    self._mailboxes.popitem(last=False)
+            else:
+                self._mailboxes.move_to_end(key)
+            return mailbox
 
-    async def _handle_list(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO Not authenticated\r\n"
-        
-        lexer = shlex.split(args)
-        if len(lexer) != 2:
-            return f"{tag} BAD Invalid LIST command format\r\n"
+    async def _handle_list(self, tag: str, args: str, context: IMAPContext, command: str = "LIST") -> bytes:
+        lexer = _split_args(args, context.literals)
+        if lexer is None or len(lexer) != 2:
+            return _BAD_FORMAT_RESPONSE % (tag.encode('ascii'), command.encode('ascii'))
         
         reference_name, mailbox_name = lexer
-        return await self._handle_list_internal(tag, reference_name, mailbox_name, context.authenticated_user, context.base_dir)
+        return await self._handle_list_internal(tag, reference_name, mailbox_name, context.authenticated_user,
+                                                context.base_dir, command)
 
-    async def _handle_list_internal(self, tag: str, reference_name: str, mailbox_name: str, user: str, base_dir: str) -> str:
+    async def _handle_list_internal(self, tag: str, reference_name: str, mailbox_name: str, user: str, base_dir: str,
+                                    command: str = "LIST") -> bytes:
+        tag_bytes = tag.encode('ascii')
         if ".." in reference_name or ".." in mailbox_name:
-            return f"{tag} NO Invalid reference name\r\n"
+            return b"%b NO Invalid reference name\r\n" % tag_bytes
 
         base_mailbox_path = os.path.join(base_dir, user)
 
         if mailbox_name == "":
-            response = '* LIST (\\Noselect) "/" ""\r\n'
-            return f'{response}{tag} OK LIST completed\r\n'
+            return f'* {command} (\\Noselect) "/" ""\r\n{tag} OK {command} completed\r\n'.encode('ascii')
         elif mailbox_name.startswith("/"):
             search_pattern = mailbox_name[1:]
         else:
             search_pattern = reference_name + mailbox_name
 
         search_pattern = search_pattern.lstrip("/")
-        response = ""
+        chunks: List[bytes] = []
 
         if search_pattern.endswith("*") or search_pattern.endswith("%"):
             prefix = search_pattern[:-1]
             
             try:
+                # INBOX is the root Maildir itself; one wrapper serves both its attributes and the folder list
+                root_mailbox = await self._get_shared_mailbox(base_mailbox_path, "")
+                folder_names = [name for name in root_mailbox.list_folders_safe() if name.startswith(prefix)]
+                lookups = [self._get_folder_attributes(base_mailbox_path, name) for name in folder_names]
                 if "INBOX".startswith(prefix):
-                    inbox_mailbox = MaildirWrapper(base_mailbox_path, folder_name="", create=False)
-                    attributes = await inbox_mailbox.get_folder_attributes()
-                    attr_str = " ".join(attributes)
-                    response += f'* LIST ({attr_str}) "/" "INBOX"\r\n'
-                
-                root_mailbox = MaildirWrapper(base_mailbox_path, folder_name="", create=False)
-                relative_folder_names = root_mailbox.list_folders_safe()
+                    folder_names.insert(0, "INBOX")
+                    lookups.insert(0, root_mailbox.get_folder_attributes())
                 
-                for relative_folder_name in relative_folder_names:
-                    if relative_folder_name.startswith(prefix):
-                        try:
-                            submailbox = MaildirWrapper(base_mailbox_path, folder_name=relative_folder_name, create=False)
-                            attributes = await submailbox.get_folder_attributes()
-                            attr_str = " ".join(attributes)
-                            response += f'* LIST ({attr_str}) "/" "{relative_folder_name}"\r\n'
-                        except FileNotFoundError:
-                            logging.warning(f"Invalid mailbox directory: {relative_folder_name}")
-                            continue
+                # Each folder is probed in a worker thread, so probe them all at once
+                for folder_name, attributes in zip(folder_names, await asyncio.gather(*lookups)):
+                    if attributes is not None:
+                        attr_str = " ".join(attributes)
+                        chunks.append(f'* {command} ({attr_str}) "/" "{folder_name}"\r\n'.encode('utf-8'))
                             
             except FileNotFoundError:
-                return f"{tag} NO [NONMAILBOX] Not a mailbox directory\r\n"
+                return b"%b NO [NONMAILBOX] Not a mailbox directory\r\n" % tag_bytes
 
         else:
             try:
-                if search_pattern == "INBOX":
-                    mailbox = MaildirWrapper(base_mailbox_path, folder_name="", create=False)
-                else:
-                    mailbox = MaildirWrapper(base_mailbox_path, folder_name=search_pattern, create=False)
-                    
+                folder_name = "" if search_pattern == "INBOX" else search_pattern
+                mailbox = await self._get_shared_mailbox(base_mailbox_path, folder_name)
+
                 attributes = await mailbox.get_folder_attributes()
                 attr_str = " ".join(attributes)
-                response += f'* LIST ({attr_str}) "/" "{search_pattern}"\r\n'
+                chunks.append(f'* {command} ({attr_str}) "/" "{search_pattern}"\r\n'.encode('utf-8'))
                 
             except FileNotFoundError:
                 pass
 
-        return f'{response}{tag} OK LIST completed\r\n'
+        chunks.append(_COMPLETED_RESPONSE % (tag.encode('ascii'), command.encode('ascii')))
+        return b"".join(chunks)
 
-    async def _handle_lsub(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO [AUTHENTICATIONFAILED] Not authenticated\r\n"
-        
-        response = await self._handle_list(tag, args, context)
-        return response.replace("LIST", "LSUB")
-
-    async def _handle_status(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO [AUTHENTICATIONFAILED] Not authenticated\r\n"
-        
-        args_parts = args.split(" ", 1)
-        if len(args_parts) < 2:
-            return f"{tag} BAD Invalid STATUS command format\r\n"
-        
-        mailbox_name = args_parts[0]
-        item_names = args_parts[1]
-        
-        if mailbox_name.startswith('"') and mailbox_name.endswith('"'):
-            mailbox_name = mailbox_name[1:-1]
+    async def _get_folder_attributes(self, base_mailbox_path: str, folder_name: str) -> Optional[List[str]]:
+        """Get a folder's LIST attributes, or None if it is not a valid mailbox"""
+        try:
+            mailbox = await self._get_shared_mailbox(base_mailbox_path, folder_name)
+        except FileNotFoundError:
+            logging.warning("Invalid mailbox directory: %s", folder_name)
+            return None
+        return await mailbox.get_folder_attributes()
+
+    async def _handle_lsub(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        return await self._handle_list(tag, args, context, command="LSUB")
+
+    async def _handle_status(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        # The mailbox may be a quoted string containing spaces; the item list follows it
+        match = _ARG_RE.match(args)
+        if match is None or match.end() == len(args):
+            return _BAD_FORMAT_RESPONSE % (tag.encode('ascii'), b"STATUS")
+        
+        quoted = match.group(1)
+        if quoted is None:
+            mailbox_name = match.group(2)
+            if context.literals and _LITERAL_MARKER_RE.fullmatch(mailbox_name):
+                # The mailbox is the only argument that can be a literal
+                mailbox_name = context.literals[0]
+        else:
+            mailbox_name = _QUOTED_ESCAPE_RE.sub(r'\1', quoted)
+        item_names = args[match.end():].strip()
         
         if item_names.startswith('(') and item_names.endswith(')'):
             item_names = item_names[1:-1]
@@ -516,48 +793,37 @@ class IMAPHandler:
             folder = mailbox_name
         
         try:
-            wrapper = MaildirWrapper(base_path, folder_name=folder, create=False)
+            # The pooled wrapper keeps the UID mapping and folder scan loaded between polls
+            wrapper = await self._get_shared_mailbox(base_path, folder)
         except FileNotFoundError:
-            return f"{tag} NO Mailbox does not exist\r\n"
+            return _NO_MAILBOX_RESPONSE % tag.encode('ascii')
         
-        parts: List[str] = []
+        parts: List[bytes] = []
         for item in items:
             key = item.upper()
             if key == 'MESSAGES':
                 cnt = await wrapper.get_message_count()
-                parts.append(f"MESSAGES {cnt}")
+                parts.append(b"MESSAGES %d" % cnt)
             elif key == 'RECENT':
                 cnt = await wrapper.get_recent_count()
-                parts.append(f"RECENT {cnt}")
+                parts.append(b"RECENT %d" % cnt)
             elif key == 'UIDNEXT':
                 u = await wrapper.get_uidnext()
-                parts.append(f"UIDNEXT {u}")
+                parts.append(b"UIDNEXT %d" % u)
             elif key == 'UIDVALIDITY':
                 uv = await wrapper.get_uidvalidity()
-                parts.append(f"UIDVALIDITY {uv}")
+                parts.append(b"UIDVALIDITY %d" % uv)
             elif key == 'UNSEEN':
-                def count_unseen():
-                    total = 0
-                    for k in wrapper.get_keys_safe():
-                        msg = wrapper.get_message_safe(k)
-                        if msg and 'S' not in msg.get_flags():
-                            total += 1
-                    return total
-                unseen = await asyncio.to_thread(count_unseen)
-                parts.append(f"UNSEEN {unseen}")
-        
-        attr_str = ' '.join(parts)
-        return f"* STATUS {mailbox_name} ({attr_str})\r\n{tag} OK STATUS completed\r\n"
-
-    async def _handle_fetch(self, tag: str, args: str, context: IMAPContext, is_uid: bool = False) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO [AUTHENTICATIONFAILED] Not authenticated\r\n"
-        elif not context.selected_folder:
-            return f"{tag} NO [CLIENTBUG] No folder selected\r\n"
+                unseen = await wrapper.get_unseen_count()
+                parts.append(b"UNSEEN %d" % unseen)
         
+        return b"* STATUS %b (%b)\r\n%b OK STATUS completed\r\n" % (
+            mailbox_name.encode('utf-8'), b" ".join(parts), tag.encode('ascii'))
+
+    async def _handle_fetch(self, tag: str, args: str, context: IMAPContext, is_uid: bool = False) -> Union[str, bytes, List[bytes]]:
         args_parts = args.split(" ", 1)
         if len(args_parts) < 2:
-            return f"{tag} BAD Invalid FETCH command format\r\n"
+            return _BAD_FORMAT_RESPONSE % (tag.encode('ascii'), b"FETCH")
         
         sequences = args_parts[0]
         item_names = args_parts[1]
@@ -567,15 +833,10 @@ class IMAPHandler:
         else:
             return await self.fetch_processor.handle_seq_fetch(tag, sequences, item_names, context)
 
-    async def _handle_uid(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO Not authenticated\r\n"
-        elif not context.selected_folder:
-            return f"{tag} NO No folder selected\r\n"
-        
+    async def _handle_uid(self, tag: str, args: str, context: IMAPContext) -> Union[str, bytes, List[bytes]]:
         args_parts = args.split(" ", 1)
         if len(args_parts) < 2:
-            return f"{tag} BAD Invalid UID command format\r\n"
+            return _BAD_FORMAT_RESPONSE % (tag.encode('ascii'), b"UID")
         
         command = args_parts[0].upper()
         command_args = args_parts[1]
@@ -583,49 +844,47 @@ class IMAPHandler:
         if command == "FETCH":
             return await self._handle_fetch(tag, command_args, context, is_uid=True)
         else:
-            return f"{tag} BAD UID subcommand '{command}' not recognized\r\n"
+            return _UNKNOWN_UID_COMMAND_RESPONSE % (tag.encode('ascii'), command.encode('ascii'))
 
-    async def _handle_close(self, tag: str, args: str, context: IMAPContext) -> str:
-        if not context.authenticated_user:
-            return f"{tag} NO Not authenticated\r\n"
-        elif not context.selected_folder:
-            return f"{tag} NO No folder selected\r\n"
-        
+    async def _handle_close(self, tag: str, args: str, context: IMAPContext) -> bytes:
         context.selected_folder = None
-        return f"{tag} OK CLOSE completed, now in authenticated state\r\n"
+        context.selected_mailbox = None
+        return _CLOSE_RESPONSE % tag.encode('ascii')
 
-    async def _handle_noop(self, tag: str, args: str, context: IMAPContext) -> str:
-        return f"{tag} OK NOOP completed\r\n"
+    async def _handle_noop(self, tag: str, args: str, context: IMAPContext) -> bytes:
+        return _NOOP_RESPONSE % tag.encode('ascii')
 
-    async def _handle_starttls(self, tag: str, context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
+    async def _handle_starttls(self, tag: str, context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Union[str, bytes]:
         """Handle STARTTLS command"""
         if context.tls_active:
-            return f"{tag} BAD TLS already active\r\n"
+            return _TLS_ACTIVE_RESPONSE % tag.encode('ascii')
         elif context.authenticated_user:
-            return f"{tag} BAD Cannot start TLS after authentication\r\n"
+            return _TLS_AFTER_AUTH_RESPONSE % tag.encode('ascii')
         else:
-            response = f"{tag} OK Begin TLS negotiation now\r\n"
-            await self._send_response(writer, response)
+            await self._send_response(writer, _BEGIN_TLS_RESPONSE % tag.encode('ascii'))
             await writer.start_tls(self.ssl_context)
             context.tls_active = True
             return ""
 
-    async def _handle_authenticate(self, tag: str, args: str, context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
+    async def _handle_authenticate(self, tag: str, args: str, context: IMAPContext, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bytes:
         """Handle AUTHENTICATE command"""
         if context.authenticated_user:
-            return f"{tag} NO Already authenticated\r\n"
+            return _ALREADY_AUTHENTICATED_RESPONSE % tag.encode('ascii')
         elif args != "PLAIN":
-            return f"{tag} NO Unsupported authentication mechanism\r\n"
+            return _UNSUPPORTED_MECHANISM_RESPONSE % tag.encode('ascii')
         
         # Send continuation prompt
-        await self._send_response(writer, "+\r\n")
+        await self._send_response(writer, _CONTINUATION)
         
         try:
-            credentials = await reader.readuntil("\r\n".encode('ascii'))
-            logging.debug(f"IMAP << {credentials.decode('ascii')}")
-            logging.debug(f"Received credentials line: {credentials!r}")
+            credentials = await reader.readuntil(b"\r\n")
+            logging.debug("IMAP << %r", credentials)
         except asyncio.IncompleteReadError:
-            return f"{tag} BAD Incomplete credentials\r\n"
+            return _INCOMPLETE_CREDENTIALS_RESPONSE % tag.encode('ascii')
+        except asyncio.LimitOverrunError as e:
+            # Left in the buffer, the oversized line would be read back as commands
+            await self._skip_line(reader, e.consumed)
+            return _BAD_CREDENTIALS_FORMAT_RESPONSE % tag.encode('ascii')
         
         try:
             credentials = credentials.rstrip(b"\r\n")
@@ -635,35 +894,58 @@ class IMAPHandler:
                 raise ValueError
             credential_parts = [part.decode('utf-8') for part in credential_parts]
         except Exception:
-            return f"{tag} BAD Invalid PLAIN credentials format\r\n"
+            return _BAD_CREDENTIALS_FORMAT_RESPONSE % tag.encode('ascii')
         
         authzid, authcid, password = credential_parts
-        logging.debug(f"authzid:{authzid} authcid:{authcid} password:{password}\r\n")
+        logging.debug("authzid:%s authcid:%s", authzid, authcid)
         
         if self.authenticator.authenticate_user(authcid, password):
             context.authenticated_user = authcid.rstrip('@' + self.host_name)
-            return f"{tag} OK AUTHENTICATE completed\r\n"
+            return _AUTHENTICATED_RESPONSE % tag.encode('ascii')
         else:
-            return f"{tag} NO Invalid credentials\r\n"
+            return _INVALID_CREDENTIALS_RESPONSE % tag.encode('ascii')
 
-    async def _handle_logout(self, tag: str, writer: asyncio.StreamWriter) -> str:
+    async def _handle_logout(self, tag: str, args: str, context: IMAPContext) -> bytes:
         """Handle LOGOUT command"""
-        response = f"* BYE IMAP4rev1 Server logging out\r\n{tag} OK LOGOUT completed\r\n"
-        await self._send_response(writer, response)
-        return ""
-
-    async def _send_response(self, writer: asyncio.StreamWriter, response: str):
+        # Queued like any reply; the session loop ends and sends it with the rest of the batch
+        return _LOGOUT_RESPONSE % tag.encode('ascii')
+
+    @staticmethod
+    def _queue_response(context: IMAPContext, response: Union[str, bytes, List[bytes]]):
+        """Hold a reply until the current batch of pipelined commands is done"""
+        if isinstance(response, list):
+            context.pending_output.extend(response)
+            context.pending_size += sum(map(len, response))
+        else:
+            response_bytes = response if isinstance(response, bytes) else response.encode('ascii')
+            context.pending_output.append(response_bytes)
+            context.pending_size += len(response_bytes)
+
+    async def _flush_responses(self, writer: asyncio.StreamWriter, context: IMAPContext):
+        """Send all held replies with a single writelines"""
+        if context.pending_output:
+            pending = context.pending_output
+            context.pending_output = []
+            context.pending_size = 0
+            # Message bodies are among the chunks; the transport takes them as they are
+            writer.writelines(pending)
+            await writer.drain()
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("IMAP >> %r", b"".join(pending))
+
+    async def _send_response(self, writer: asyncio.StreamWriter, response: Union[str, bytes]):
         """Send response to client"""
-        response_bytes = response.encode('ascii')
+        response_bytes = response if isinstance(response, bytes) else response.encode('ascii')
         writer.write(response_bytes)
         await writer.drain()
-        logging.debug(f"IMAP >> {response_bytes}")
+        # FETCH replies can be megabytes; don't repr them unless debug output is on
+        logging.debug("IMAP >> %r", response_bytes)
 
-    async def _send_error_response(self, writer: asyncio.StreamWriter):
+    async def _send_error_response(self, writer: asyncio.StreamWriter, context: IMAPContext):
         """Send error response to client"""
-        farewell = "* BYE Server error, closing connection\r\n"
         try:
-            await self._send_response(writer, farewell)
+            self._queue_response(context, _SERVER_ERROR_BYE)
+            await self._flush_responses(writer, context)
         except Exception as send_err:
             logging.error(f"Failed to send BYE: {send_err}")
 
@@ -16,7 +16,7 @@ import logging
 from aiosmtpd.controller import Controller
 from asyncio import start_server
 from server.smtp_server import SMTPHandler, Authenticator
-from server.imap_server import IMAPHandler
+from server.imap_server import IMAPHandler, MAX_LINE_LENGTH
 
 async def initialize_storage():
     """Initialize the storage directory structure."""
@@ -43,7 +43,9 @@ async def start_smtp_server():
 async def start_imap_server():
     """Start the IMAP server."""
     imap_handler = IMAPHandler(configs.server_storage_path, configs.host_name, ssl_context, configs.auth_type)
-    server = await start_server(imap_handler.handle_client, configs.host_name, configs.imap_port)
+    # The limit bounds each connection's read buffer; longer lines are rejected, not accumulated
+    server = await start_server(imap_handler.handle_client, configs.host_name, configs.imap_port,
+                                limit=MAX_LINE_LENGTH)
     assigned_port = server.sockets[0].getsockname()[1]
     return server, assigned_port
 
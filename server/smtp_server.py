@@ -6,7 +6,6 @@ from email.parser import BytesParser
 from email.policy import default
 from email.utils import parseaddr
 from aiosmtpd.smtp import SMTP, Session, Envelope
-from mailbox import MaildirMessage
 from server.authenticator import LDAPAuthenticator
 import os
 import logging
@@ -26,24 +25,24 @@ class Authenticator:
     ) -> AuthResult:
         fail_nothandled = AuthResult(success=False, handled=False)
         if mechanism not in ("LOGIN", "PLAIN"):
-            logging.info(f"Unsupported auth mechanism: {mechanism}")
+            logging.info("Unsupported auth mechanism: %s", mechanism)
             return fail_nothandled
         if not isinstance(auth_data, LoginPassword):
-            logging.info(f"Invalid auth_data type: {type(auth_data)}")
+            logging.info("Invalid auth_data type: %s", type(auth_data))
             return fail_nothandled
         
         username = auth_data.login.decode()
         password = auth_data.password.decode()
-        logging.info(f"Attempting authentication for username: {username}")
+        logging.info("Attempting authentication for username: %s", username)
         
         if self.authenticator.authenticate_user(username, password):
             # Set session as authenticated
             session.authenticated = True
-            logging.info(f"Authentication SUCCESS for {username}, session.authenticated = {session.authenticated}")
-            logging.info(f"Session ID: {id(session)}")
+            logging.info("Authentication SUCCESS for %s, session.authenticated = %s", username, session.authenticated)
+            logging.info("Session ID: %s", id(session))
             return AuthResult(success=True, auth_data=auth_data)
         else:
-            logging.info(f"Authentication FAILED for {username}")
+            logging.info("Authentication FAILED for %s", username)
             return AuthResult(success=False)
                 
 
@@ -60,23 +59,22 @@ class SMTPHandler:
         address: str, 
         mail_options: List[str]
     ) -> str:
-        logging.info(f"handle_MAIL called for {address}")
-        logging.info(f"Session ID: {id(session)}")
-        logging.info(f"Session authenticated: {getattr(session, 'authenticated', 'NOT SET')}")
-        logging.info(f"Session attributes: {dir(session)}")
+        logging.info("handle_MAIL called for %s", address)
+        logging.info("Session ID: %s", id(session))
+        logging.info("Session authenticated: %s", getattr(session, 'authenticated', 'NOT SET'))
 
         # Check if TLS is required and active
         if not getattr(session, 'ssl', False):
-            logging.info(f"MAIL: TLS required")
+            logging.info("MAIL: TLS required")
             return '530 5.7.0 Must issue a STARTTLS command first'
         
         # Check authentication
         if not getattr(session, 'authenticated', False):
-            logging.info(f"MAIL: Authentication required for {address}")
+            logging.info("MAIL: Authentication required for %s", address)
             return '530 5.7.0 Authentication required'
         
         envelope.mail_from = address
-        logging.info(f"MAIL FROM: {address} accepted")
+        logging.info("MAIL FROM: %s accepted", address)
         return '250 OK'
 
     async def handle_RCPT(
@@ -102,36 +100,43 @@ class SMTPHandler:
         envelope: Envelope
     ) -> str:
         content = cast(bytes, envelope.original_content)
-        msg = BytesParser(policy=default).parsebytes(content)
+        # Only the headers are inspected; the message is stored as received instead of
+        # being re-serialized from a parsed MIME tree for every mailbox it goes to
+        msg = BytesParser(policy=default).parsebytes(content, headersonly=True)
+        added_headers: List[str] = []
         
         # Ensure required headers are present
         if not msg.get('Date'):
-            msg['Date'] = formatdate(localtime=True)
+            added_headers.append(f"Date: {formatdate(localtime=True)}")
         
         if not msg.get('Message-ID'):
-            msg['Message-ID'] = make_msgid(domain=self.host_name)
+            added_headers.append(f"Message-ID: {make_msgid(domain=self.host_name)}")
         
         # Ensure From header is present and valid
         if not msg.get('From'):
             if envelope.mail_from:
-                msg['From'] = envelope.mail_from
+                added_headers.append(f"From: {envelope.mail_from}")
             else:
-                msg['From'] = 'unknown@' + self.host_name
+                added_headers.append(f"From: unknown@{self.host_name}")
 
         # Ensure To header is present
         if not msg.get('To') and envelope.rcpt_tos:
-            msg['To'] = ', '.join(envelope.rcpt_tos)
+            added_headers.append(f"To: {', '.join(envelope.rcpt_tos)}")
         
-        # Create MaildirMessage from the enhanced message
-        maildir_msg = MaildirMessage(msg)
+        # Maildir files use bare LF line endings
+        maildir_msg = "".join(f"{header}\n" for header in added_headers).encode('utf-8') + \
+                      content.replace(b'\r\n', b'\n')
 
         # Store a copy in sender's Sent folder
         raw_from = cast(str, envelope.mail_from)
         _, sender_address = parseaddr(raw_from)
         sender_name = sender_address.split("@")[0]
-        mailbox = await MaildirWrapper.create_mailbox(os.path.join(self.mail_dir, sender_name))
-        sent_wrapper = MaildirWrapper(mailbox.base_path, folder_name="Sent", create=True)
+        # create=True lays out the user's base Maildir too; a separate create_mailbox wrapper
+        # would sync INBOX and write its own, possibly older, copy of the mapping later
+        sent_wrapper = await MaildirWrapper.create(os.path.join(self.mail_dir, sender_name),
+                                                   folder_name="Sent", create=True)
         await sent_wrapper.save_message(maildir_msg)
+        await sent_wrapper.flush()
 
         # Deliver message to each recipient's INBOX
         for recipient in envelope.rcpt_tos:
@@ -139,8 +144,8 @@ class SMTPHandler:
             recipient_name = recipient_address.split("@")[0]
             if recipient_name == sender_name:
                 continue
-            mailbox = await MaildirWrapper.create_mailbox(os.path.join(self.mail_dir, recipient_name))
-            inbox_wrapper = MaildirWrapper(mailbox.base_path, create=True)
+            inbox_wrapper = await MaildirWrapper.create(os.path.join(self.mail_dir, recipient_name), create=True)
             await inbox_wrapper.save_message(maildir_msg)
+            await inbox_wrapper.flush()
 
         return '250 Message accepted for delivery'
\ No newline at end of file
@@ -1,11 +1,32 @@
 import asyncio
+import contextlib
 import json
 import os
 import time
 import threading
-import aiofiles
-from mailbox import Maildir, MaildirMessage
-from typing import Dict, Optional, TypedDict, List
+from collections import OrderedDict
+from mailbox import Maildir, MaildirMessage, NoSuchMailboxError
+from typing import Any, Dict, FrozenSet, Optional, TypedDict, List, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Mappings larger than this are stream-parsed (when ijson is available) so the raw
+# bytes and the parsed dict are never held in memory at the same time
+STREAM_PARSE_THRESHOLD = 4 * 1024 * 1024
+
+# Seconds to wait before writing the UID mapping after save_message, so bulk appends share one write
+SAVE_DEBOUNCE_DELAY = 0.1
+
+# Parsed messages kept per wrapper; FETCH often asks for the same message several times
+MESSAGE_CACHE_SIZE = 64
 
 
 class FolderUIDData(TypedDict):
@@ -17,8 +38,120 @@ class FolderUIDData(TypedDict):
 class UIDData(TypedDict):
     folders: Dict[str, FolderUIDData]
 
+class FolderStats(TypedDict):
+    exists: int
+    recent: int
+    unseen_keys: FrozenSet[str]
+
+# A change made in the same mtime tick as a scan leaves cur/ and new/ mtimes as they were, so
+# a scan only vouches for mtimes it started this long after (as mailbox.Maildir does)
+MTIME_SETTLE_NS = 2 * 1_000_000_000
+
+# Folders whose last scan is kept for other wrappers; matches the IMAP server's wrapper pool
+MAX_CACHED_FOLDER_STATS = 128
+
+# Folder path -> ((cur, new) mtimes, stats) from the last scan, reused while the mtimes are
+# unchanged, least recently used first. Wrappers are created per command, so this lives at
+# module level; scans run in worker threads, hence the lock. Key -> path maps stay per wrapper.
+_FOLDER_STATS: OrderedDict[str, Tuple[tuple, FolderStats]] = OrderedDict()
+_folder_stats_lock = threading.Lock()
+
+def _mtimes_settled(mtimes: tuple, scan_started_ns: int) -> bool:
+    return scan_started_ns - max(mtimes) >= MTIME_SETTLE_NS
+
+def _json_loads(content: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def _json_dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
+
+def _restore_uid_to_key(folder_data: Dict[str, Any]) -> None:
+    # uid_pairs is stored as [[uid, key], ...] so dict() rebuilds it in one pass
+    if 'uid_pairs' in folder_data:
+        folder_data['uid_to_key'] = dict(folder_data.pop('uid_pairs'))
+    elif 'uid_to_key' in folder_data:
+        # Older mappings stored uid_to_key as an object, whose keys JSON makes strings
+        folder_data['uid_to_key'] = {int(uid): key for uid, key in folder_data['uid_to_key'].items()}
+
+def _sync_load_streaming(path: str, restore: bool = True) -> Dict[str, Any]:
+    folders: Dict[str, Any] = {}
+    try:
+        with open(path, 'rb') as f:
+            for folder_name, folder_data in ijson.kvitems(f, 'folders'):
+                if restore:
+                    _restore_uid_to_key(folder_data)
+                folders[folder_name] = folder_data
+    except ijson.JSONError as e:
+        raise ValueError(f"Invalid UID mapping file: {e}") from e
+    return {'folders': folders}
+
+def _sync_read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _sync_write(path: str, data: bytes) -> None:
+    # Write next to the target and rename over it, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# One lock per mapping file; wrappers on the SMTP and IMAP event loops share it
+_uid_file_locks: Dict[str, threading.Lock] = {}
+
+# Mapping file path -> (mtime after our last write, file contents as written), so a save
+# only re-reads the file when another process changed it. Guarded by the file's lock.
+_uid_file_contents: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+def _sync_load_stored(path: str) -> Dict[str, Any]:
+    """Read the mapping file in its stored form; raises ValueError if it cannot be parsed"""
+    if ijson is not None and os.path.getsize(path) > STREAM_PARSE_THRESHOLD:
+        return _sync_load_streaming(path, restore=False)
+    data = _json_loads(_sync_read(path))
+    if not isinstance(data, dict):
+        raise ValueError("Invalid UID mapping file: not an object")
+    return data
+
+def _sync_merge_folder(path: str, folder_key: str, folder_data: Dict[str, Any]) -> int:
+    # Each wrapper owns one folder entry, so merge it into the file instead of
+    # replacing entries other wrappers may have written since we loaded it
+    with _uid_file_locks.setdefault(path, threading.Lock()):
+        try:
+            mtime: Optional[int] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        cached = _uid_file_contents.get(path)
+        if cached is not None and cached[0] == mtime:
+            data = cached[1]
+        elif mtime is None:
+            data = {'folders': {}}
+        else:
+            # A corrupt file raises here rather than being replaced by this folder alone
+            data = _sync_load_stored(path)
+        data.setdefault('folders', {})[folder_key] = folder_data
+        try:
+            _sync_write(path, _json_dumps(data))
+        except OSError:
+            _uid_file_contents.pop(path, None)
+            raise
+        mtime = os.stat(path).st_mtime_ns
+        _uid_file_contents[path] = (mtime, data)
+        return mtime
+
 class MaildirWrapper:
-    def __init__(self, mailbox_path: str, folder_name: Optional[str] = None, create: bool = False):
+    def __init__(self, mailbox_path: str, folder_name: Optional[str] = None, create: bool = False,
+                 thread_safe: bool = False):
         self.base_path = mailbox_path
 
         # 1) Ensure the full maildir layout for the base path
@@ -27,43 +160,71 @@ class MaildirWrapper:
             for sub in ("cur", "new", "tmp"):
                 os.makedirs(os.path.join(mailbox_path, sub), exist_ok=True)
 
-        # 2) Now instantiate the std-lib Maildir
-        base_maildir = Maildir(mailbox_path, create=create)
-        
-        if folder_name:
-            # Handle folder navigation
-            parts = folder_name.split("/")
-            current = base_maildir
-            for part in parts:
-                if create:
-                     # instead of current.add_folder(), recreate full layout
-                    folder_path = os.path.join(current._path, "." + part)
-                    # bootstrap layout for the sub-folder
-                    for sub in ("cur", "new", "tmp"):
-                        os.makedirs(os.path.join(folder_path, sub), exist_ok=True)
-                    # maildirfolder marker
-                    os.makedirs(folder_path, exist_ok=True)
-                    open(os.path.join(folder_path, "maildirfolder"), "a").close()
-                    current = Maildir(folder_path, create=True)
-                else:
-                    try:
-                        current = current.get_folder(part)
-                    except FileNotFoundError:
-                        raise FileNotFoundError(f"Mailbox folder '{folder_name}' does not exist")
-            self.maildir = current
+        # 2) Now instantiate the std-lib Maildir for the base path or the folder
+        if folder_name and not create:
+            # Open the folder directly rather than instantiating a Maildir for every level above it
+            folder_path = os.path.join(mailbox_path, *("." + part for part in folder_name.split("/")))
+            try:
+                self.maildir = Maildir(folder_path, create=False)
+            except NoSuchMailboxError:
+                raise FileNotFoundError(f"Mailbox folder '{folder_name}' does not exist")
+            self.folder_name = folder_name
+        elif folder_name:
+            folder_path = mailbox_path
+            for part in folder_name.split("/"):
+                # instead of current.add_folder(), recreate full layout
+                folder_path = os.path.join(folder_path, "." + part)
+                # bootstrap layout for the sub-folder
+                for sub in ("cur", "new", "tmp"):
+                    os.makedirs(os.path.join(folder_path, sub), exist_ok=True)
+                # maildirfolder marker
+                open(os.path.join(folder_path, "maildirfolder"), "a").close()
+            self.maildir = Maildir(folder_path, create=True)
             self.folder_name = folder_name
         else:
-            self.maildir = base_maildir
+            try:
+                self.maildir = Maildir(mailbox_path, create=create)
+            except NoSuchMailboxError:
+                raise FileNotFoundError(f"Mailbox '{mailbox_path}' does not exist")
             self.folder_name = ""
         
+        # Hot paths scan these on every request, so join them once
+        self._cur_dir = os.path.join(self.path, 'cur')
+        self._new_dir = os.path.join(self.path, 'new')
+
         # UID file is always at the base path (per-user, not per-folder)
         self.uid_file = os.path.join(self.base_path, ".uid_mapping")
         self._uid_data = None
-        self._lock = threading.RLock()
+        self._folder_cache: Optional[FolderUIDData] = None
+        # Mapping file mtime as of our last load or write; a newer one was written by another wrapper
+        self._uid_file_mtime: Optional[int] = None
+        # (uid, key) pairs in UID order, rebuilt only after the mapping changes
+        self._uid_pairs: Optional[List[Tuple[int, str]]] = None
+        # Only needed when one wrapper's Maildir is shared across threads; a single
+        # event loop already serializes access, so default to a no-op context
+        self._lock = threading.RLock() if thread_safe else contextlib.nullcontext()
+        # (cur mtime, new mtime) of the last key scan made well after them; unchanged means no adds/removes
+        self._last_sync_mtime = (0, 0)
+        self._dirty = False
+        self._sync_inflight: Optional[asyncio.Future] = None
+        self._save_task: Optional[asyncio.Task] = None
+        self._save_lock = asyncio.Lock()
+        # key -> message file path as of the last scan, for reads that skip Maildir
+        self._file_paths: Dict[str, str] = {}
+        self._paths_mtimes: Optional[tuple] = None
+        self._stats: Optional[FolderStats] = None
+        # key -> parsed message, least recently used first
+        self._msg_cache: OrderedDict[str, MaildirMessage] = OrderedDict()
+
+    @classmethod
+    async def create(cls, mailbox_path: str, folder_name: Optional[str] = None, create: bool = False,
+                     thread_safe: bool = False):
+        """Construct a wrapper off the event loop; the folder walk stats every level"""
+        return await asyncio.to_thread(cls, mailbox_path, folder_name, create, thread_safe)
 
     @classmethod
     async def create_mailbox(cls, mailbox_path: str):
-        instance = cls(mailbox_path, "", True)
+        instance = await cls.create(mailbox_path, "", True)
         await instance._sync_uids()
         return instance
 
@@ -74,16 +235,27 @@ class MaildirWrapper:
     def get_keys_safe(self) -> List[str]:
         """Get a thread-safe copy of maildir keys"""
         with self._lock:
-            return list(self.maildir.keys())
+            return list(self._scan_keys())
     
     def get_message_safe(self, key: str) -> Optional[MaildirMessage]:
         """Get a message by key in a thread-safe way"""
+        # Scans in worker threads prune the cache, so a shared wrapper guards it too
         with self._lock:
+            message = self._msg_cache.get(key)
+            if message is not None:
+                self._msg_cache.move_to_end(key)
+                return message
+
             try:
-                return self.maildir.get_message(key)
+                message = self.maildir.get_message(key)
             except KeyError:
                 return None
 
+            self._msg_cache[key] = message
+            if len(self._msg_cache) > MESSAGE_CACHE_SIZE:
+                self._msg_cache.popitem(last=False)
+            return message
+
     def list_folders_safe(self) -> List[str]:
         """Get a thread-safe list of folder names"""
         with self._lock:
@@ -92,8 +264,13 @@ class MaildirWrapper:
     @staticmethod
     def is_maildir(path: str) -> bool:
         """Check if the given path is a valid Maildir directory"""
-        return os.path.isdir(path) and os.path.exists(os.path.join(path, 'cur')) and \
-               os.path.exists(os.path.join(path, 'new')) and os.path.exists(os.path.join(path, 'tmp'))
+        # One directory listing instead of a stat per subdirectory
+        try:
+            with os.scandir(path) as it:
+                names = {entry.name for entry in it if entry.is_dir()}
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        return {'cur', 'new', 'tmp'} <= names
 
     def _get_folder_key(self) -> str:
         """Get the folder key for the UID data structure"""
@@ -101,6 +278,10 @@ class MaildirWrapper:
 
     async def _get_folder_uid_data(self) -> FolderUIDData:
         """Get UID data for the current folder"""
+        # Once the folder entry exists it stays valid until the mapping is reloaded
+        if self._folder_cache is not None:
+            return self._folder_cache
+
         uid_data = await self._get_uid_data()
         folder_key = self._get_folder_key()
         
@@ -117,81 +298,185 @@ class MaildirWrapper:
                 'uid_to_key': {}
             }
             self._uid_data = uid_data
+            self._folder_cache = uid_data['folders'][folder_key]
             await self._save_uid_data()
         
-        return uid_data['folders'][folder_key]
+        self._folder_cache = uid_data['folders'][folder_key]
+        return self._folder_cache
 
     async def _load_uid_data(self) -> UIDData:
         """Load UID mapping from file asynchronously"""
         try:
             if os.path.exists(self.uid_file):
-                async with aiofiles.open(self.uid_file, 'r') as f:
-                    content = await f.read()
-                    data = json.loads(content)
-                    
-                    # Ensure folders dict exists
-                    if 'folders' not in data:
-                        data['folders'] = {}
-                    
-                    # Fix integer keys in uid_to_key for all folders
-                    for _, folder_data in data['folders'].items():
-                        if 'uid_to_key' in folder_data:
-                            uid_to_key_fixed = {}
-                            for uid_str, key in folder_data['uid_to_key'].items():
-                                uid_to_key_fixed[int(uid_str)] = key
-                            folder_data['uid_to_key'] = uid_to_key_fixed
-                    
-                    return data
-        except (json.JSONDecodeError, IOError, OSError):
+                self._uid_file_mtime = os.stat(self.uid_file).st_mtime_ns
+                if ijson is not None and os.path.getsize(self.uid_file) > STREAM_PARSE_THRESHOLD:
+                    return await asyncio.to_thread(_sync_load_streaming, self.uid_file)
+
+                content = await asyncio.to_thread(_sync_read, self.uid_file)
+                data = _json_loads(content)
+                
+                # Ensure folders dict exists
+                if 'folders' not in data:
+                    data['folders'] = {}
+                
+                for folder_data in data['folders'].values():
+                    _restore_uid_to_key(folder_data)
+                
+                return data
+        except (ValueError, IOError, OSError):
             pass
 
         # Create new UID data structure
         return {'folders': {}}
 
     async def _save_uid_data(self):
-        """Save UID mapping to file asynchronously"""
+        """Save this folder's UID mapping to file asynchronously"""
+        # Serialize writers so an older snapshot can never replace a newer one
+        async with self._save_lock:
+            # Clear before snapshotting so changes made during the write are not lost
+            self._dirty = False
+            folder_data = self._folder_cache
+            if folder_data is None:
+                return
+            snapshot = {
+                'uidvalidity': folder_data['uidvalidity'],
+                'uidnext': folder_data['uidnext'],
+                'key_to_uid': dict(folder_data['key_to_uid']),
+                'uid_pairs': list(folder_data['uid_to_key'].items())
+            }
+            try:
+                self._uid_file_mtime = await asyncio.to_thread(
+                    _sync_merge_folder, self.uid_file, self._get_folder_key(), snapshot)
+            except (IOError, ValueError) as e:
+                self._dirty = True
+                print(f"Warning: Could not save UID data: {e}")
+
+    def _mark_dirty(self):
+        """Schedule a coalesced save of the UID mapping"""
+        self._dirty = True
+        if self._save_task is None:
+            self._save_task = asyncio.get_running_loop().create_task(self._debounced_flush())
+
+    async def _debounced_flush(self):
         try:
-            content = json.dumps(self._uid_data, indent=2)
-            async with aiofiles.open(self.uid_file, 'w') as f:
-                await f.write(content)
-        except IOError as e:
-            print(f"Warning: Could not save UID data: {e}")
+            await asyncio.sleep(SAVE_DEBOUNCE_DELAY)
+            if self._dirty:
+                await self._save_uid_data()
+        finally:
+            self._save_task = None
+
+    async def flush(self):
+        """Write any pending UID mapping changes now"""
+        if self._dirty:
+            await self._save_uid_data()
+        else:
+            # A debounced write may be in progress; wait for it to land
+            async with self._save_lock:
+                pass
 
     async def _get_uid_data(self) -> UIDData:
         """Get UID data, loading if necessary"""
         if self._uid_data is None:
             self._uid_data = await self._load_uid_data()
+            self._folder_cache = None
+            self._uid_pairs = None
         return self._uid_data
 
-    async def _sync_uids(self):
+    def _uid_file_changed(self) -> bool:
+        """Check whether another wrapper rewrote the mapping since we loaded or saved it"""
+        # Pending changes of our own would be lost by a reload, so keep them
+        if self._dirty or self._save_task is not None:
+            return False
+        try:
+            return os.stat(self.uid_file).st_mtime_ns != self._uid_file_mtime
+        except OSError:
+            return False
+
+    def _scan_keys(self) -> set:
+        """Collect message keys, reusing this wrapper's last scan when cur/ and new/ are unchanged"""
+        with self._lock:
+            self._get_stats_locked(need_paths=True)
+            return set(self._file_paths)
+
+    def _get_dir_mtimes(self) -> Optional[tuple]:
+        """Get mtimes of cur/ and new/, or None if they cannot be read"""
+        try:
+            cur_m = os.stat(self._cur_dir).st_mtime_ns
+            new_m = os.stat(self._new_dir).st_mtime_ns
+        except OSError:
+            return None
+        return (cur_m, new_m)
+
+    async def _sync_uids(self) -> FolderUIDData:
+        """Synchronize UIDs, sharing one scan between concurrent callers"""
+        if self._sync_inflight is not None:
+            return await asyncio.shield(self._sync_inflight)
+
+        inflight = asyncio.get_running_loop().create_future()
+        self._sync_inflight = inflight
+        try:
+            result = await self._do_sync_uids()
+        except asyncio.CancelledError:
+            inflight.cancel()
+            raise
+        except Exception as e:
+            inflight.set_exception(e)
+            # The caller re-raises below; don't warn if no one else was waiting
+            inflight.exception()
+            raise
+        else:
+            inflight.set_result(result)
+            return result
+        finally:
+            self._sync_inflight = None
+
+    async def _do_sync_uids(self) -> FolderUIDData:
         """Synchronize UIDs with current maildir contents for this folder"""
         folder_uid_data = await self._get_folder_uid_data()
 
-        # Get current keys (this is the expensive I/O operation) - thread-safe
-        def get_keys_safely():
-            with self._lock:
-                return set(list(self.maildir.keys()))
-        
-        current_keys = await asyncio.to_thread(get_keys_safely)
-        mapped_keys = set(folder_uid_data['key_to_uid'].keys())
+        # Skip the directory scan if nothing was added or removed since the last one
+        mtimes = self._get_dir_mtimes()
+        if mtimes is not None and mtimes == self._last_sync_mtime:
+            return folder_uid_data
+        scan_started = time.time_ns()
+
+        # Long-lived wrappers must pick up UIDs that SMTP delivery assigned to the new messages
+        if self._uid_file_changed():
+            # The folder entry and the pairs built from it are views of the old load
+            self._uid_data = None
+            self._folder_cache = None
+            self._uid_pairs = None
+            folder_uid_data = await self._get_folder_uid_data()
+
+        # Get current keys (this is the expensive I/O operation)
+        current_keys = await asyncio.to_thread(self._scan_keys)
+        key_to_uid = folder_uid_data['key_to_uid']
+        uid_to_key = folder_uid_data['uid_to_key']
+        mapped_keys = key_to_uid.keys()
 
         # Remove UIDs for deleted messages
         deleted_keys = mapped_keys - current_keys
-        for key in deleted_keys:
-            uid = folder_uid_data['key_to_uid'].pop(key, None)
-            if uid:
-                folder_uid_data['uid_to_key'].pop(uid, None)
+        if deleted_keys:
+            doomed_uids = [key_to_uid.pop(key) for key in deleted_keys]
+            for uid in doomed_uids:
+                uid_to_key.pop(uid, None)
 
-        # Add UIDs for new messages
+        # Add UIDs for new messages; maildir keys start with the delivery time,
+        # so sorting hands out UIDs in arrival order
         new_keys = current_keys - mapped_keys
-        for key in new_keys:
-            uid = folder_uid_data['uidnext']
-            folder_uid_data['key_to_uid'][key] = uid
-            folder_uid_data['uid_to_key'][uid] = key
-            folder_uid_data['uidnext'] = uid + 1
+        if new_keys:
+            start = folder_uid_data['uidnext']
+            new_map = {key: uid for uid, key in enumerate(sorted(new_keys), start)}
+            key_to_uid.update(new_map)
+            uid_to_key.update(zip(new_map.values(), new_map.keys()))
+            folder_uid_data['uidnext'] = start + len(new_map)
 
         if deleted_keys or new_keys:
-            await self._save_uid_data()
+            self._uid_pairs = None
+            self._mark_dirty()
+        if mtimes is not None and _mtimes_settled(mtimes, scan_started):
+            self._last_sync_mtime = mtimes
+        return folder_uid_data
 
     async def get_uidvalidity(self) -> int:
         """Get UIDVALIDITY value for this folder"""
@@ -200,124 +485,252 @@ class MaildirWrapper:
 
     async def get_uidnext(self) -> int:
         """Get UIDNEXT value for this folder"""
-        await self._sync_uids()
-        folder_uid_data = await self._get_folder_uid_data()
+        folder_uid_data = await self._sync_uids()
         return folder_uid_data['uidnext']
 
-    async def save_message(self, message: MaildirMessage) -> int:
+    async def save_message(self, message: Union[MaildirMessage, bytes]) -> int:
         """Save a message and assign a UID"""
-        await self._sync_uids()
+        folder_uid_data = await self._sync_uids()
         
         def add_message():
             with self._lock:
                 return self.maildir.add(message)
         
         key = await asyncio.to_thread(add_message)
-        folder_uid_data = await self._get_folder_uid_data()
+        self._invalidate_stats()
         uid = folder_uid_data['uidnext']
         folder_uid_data['key_to_uid'][key] = uid
         folder_uid_data['uid_to_key'][uid] = key
         folder_uid_data['uidnext'] += 1
-        await self._save_uid_data()
+        self._uid_pairs = None
+        self._mark_dirty()
         return uid
 
+    async def get_uid_key_pairs(self) -> List[Tuple[int, str]]:
+        """Get (uid, key) for every message in UID order, i.e. sequence number order; do not modify it"""
+        folder_uid_data = await self._sync_uids()
+        if self._uid_pairs is None:
+            self._uid_pairs = sorted(folder_uid_data['uid_to_key'].items())
+        return self._uid_pairs
+
     async def load_message_by_uid(self, uid: int) -> Optional[MaildirMessage]:
         """Load a message by its UID"""
-        await self._sync_uids()
-        folder_uid_data = await self._get_folder_uid_data()
+        folder_uid_data = await self._sync_uids()
         key = folder_uid_data['uid_to_key'].get(uid)
         if key:
             return self.get_message_safe(key)
         return None
 
+    def _read_raw(self, key: str) -> Optional[bytes]:
+        """Read a message file's bytes, relocating it if a flag change renamed it"""
+        path = self._file_paths.get(key)
+        if path is not None:
+            try:
+                return _sync_read(path)
+            except FileNotFoundError:
+                pass
+        found = self._find_message_file(key)
+        if not found:
+            return None
+        self._file_paths[key] = found[0]
+        try:
+            return _sync_read(found[0])
+        except FileNotFoundError:
+            return None
+
+    def get_indexed_flags(self, key: str) -> Optional[Tuple[str, bool]]:
+        """Get (Maildir flags, still in new/) from the last scan's filename, or None if the key is unknown"""
+        path = self._file_paths.get(key)
+        if path is None:
+            return None
+        sub_dir, name = os.path.split(path)
+        info = name.partition(self.maildir.colon)[2]
+        return (info[2:] if info.startswith('2,') else ''), sub_dir == self._new_dir
+
+    async def load_raw(self, key: str) -> Optional[bytes]:
+        """Load a message's raw bytes by key without parsing it"""
+        return await asyncio.to_thread(self._read_raw, key)
+
+    async def load_raw_by_uid(self, uid: int) -> Optional[bytes]:
+        """Load a message's raw bytes by its UID without parsing it"""
+        folder_uid_data = await self._sync_uids()
+        key = folder_uid_data['uid_to_key'].get(uid)
+        if key:
+            return await self.load_raw(key)
+        return None
+
+    def _scan_stats(self) -> FolderStats:
+        """Collect keys, counts and unseen keys in one pass over cur/ and new/"""
+        # Maildir keeps flags in the filename suffix (":2,<flags>"), no need to open messages
+        colon = self.maildir.colon
+        paths = {}
+        unseen = set()
+        recent = 0
+        for sub_dir in (self._cur_dir, self._new_dir):
+            with os.scandir(sub_dir) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    key, _, info = entry.name.partition(colon)
+                    paths[key] = entry.path
+                    if not info.startswith('2,') or 'S' not in info[2:]:
+                        unseen.add(key)
+                    if sub_dir is self._new_dir:
+                        recent += 1
+        self._set_file_paths(paths)
+        return {'exists': len(paths), 'recent': recent, 'unseen_keys': frozenset(unseen)}
+
+    def _set_file_paths(self, paths: Dict[str, str]):
+        """Adopt a fresh key -> path map, dropping cached messages whose file was renamed or removed"""
+        # A rename means another session changed the flags (or subdir) the cached copy carries
+        old_paths = self._file_paths
+        self._file_paths = paths
+        stale = [key for key in self._msg_cache if old_paths.get(key) != paths.get(key)]
+        for key in stale:
+            del self._msg_cache[key]
+
+    def _get_stats(self) -> FolderStats:
+        """Get folder stats, rescanning only if cur/ or new/ changed since the last scan"""
+        with self._lock:
+            return self._get_stats_locked()
+
+    def _get_stats_locked(self, need_paths: bool = False) -> FolderStats:
+        mtimes = self._get_dir_mtimes()
+        if mtimes is not None:
+            # Our own last scan also left the key -> path map; the shared entry only has counts
+            if mtimes == self._paths_mtimes:
+                return self._stats
+            if not need_paths:
+                with _folder_stats_lock:
+                    cached = _FOLDER_STATS.get(self.path)
+                    if cached is not None and cached[0] == mtimes:
+                        _FOLDER_STATS.move_to_end(self.path)
+                        return cached[1]
+        scan_started = time.time_ns()
+        stats = self._scan_stats()
+        self._stats = stats
+        # Mtimes this recent may not show a change made right after the scan, so rescan next time
+        settled = mtimes is not None and _mtimes_settled(mtimes, scan_started)
+        self._paths_mtimes = mtimes if settled else None
+        if settled:
+            with _folder_stats_lock:
+                _FOLDER_STATS[self.path] = (mtimes, stats)
+                _FOLDER_STATS.move_to_end(self.path)
+                if len(_FOLDER_STATS) > MAX_CACHED_FOLDER_STATS:
+                    _FOLDER_STATS.popitem(last=False)
+        return stats
+
+    def _invalidate_stats(self):
+        """Drop cached stats after this wrapper changed the folder"""
+        self._paths_mtimes = None
+        with _folder_stats_lock:
+            _FOLDER_STATS.pop(self.path, None)
+
+    async def get_folder_stats(self) -> FolderStats:
+        """Get EXISTS/RECENT counts and unseen keys for the folder"""
+        return await asyncio.to_thread(self._get_stats)
+
     async def get_message_count(self) -> int:
         """Get total message count"""
-        def count_messages():
-            with self._lock:
-                return len(self.maildir)
-        return await asyncio.to_thread(count_messages)
+        return (await self.get_folder_stats())['exists']
 
     async def get_recent_count(self) -> int:
         """Get count of recent (new) messages"""
-        new_dir = os.path.join(self.path, 'new')
-
-        def count_files():
-            if os.path.exists(new_dir):
-                return len([f for f in os.listdir(new_dir) 
-                           if os.path.isfile(os.path.join(new_dir, f))])
-            return 0
+        return (await self.get_folder_stats())['recent']
 
-        return await asyncio.to_thread(count_files)
+    async def get_unseen_count(self) -> int:
+        """Get count of messages without the Seen flag"""
+        return len((await self.get_folder_stats())['unseen_keys'])
 
     async def get_first_unseen_seq(self) -> Optional[int]:
         """Get sequence number of first unseen message"""
-        def find_first_unseen():
-            with self._lock:
-                keys_list = list(self.maildir.keys())
-                
-                for i, key in enumerate(keys_list):
-                    try:
-                        message = self.get_message_safe(key)
-                        if message and "S" not in message.get_flags():
-                            return i + 1  # Sequence numbers are 1-based
-                    except KeyError:
-                        continue
-                return None
-
-        return await asyncio.to_thread(find_first_unseen)
+        uid_pairs = await self.get_uid_key_pairs()
+        unseen_keys = (await self.get_folder_stats())['unseen_keys']
+        # Sequence numbers follow UID order and are 1-based
+        for seq, (_, key) in enumerate(uid_pairs, 1):
+            if key in unseen_keys:
+                return seq
+        return None
 
-    async def get_folder_attributes(self) -> List[str]:
+    def _collect_folder_attributes(self) -> List[str]:
+        """Probe new/ and the folder's subdirectories in one pass"""
         attributes: List[str] = []
 
-        async def has_new_messages(folder_path: str) -> bool:
-            """Check if folder has new/unseen messages"""
-            new_dir = os.path.join(folder_path, "new")
-            try:
-                return len(os.listdir(new_dir)) > 0
-            except OSError:
-                return False
-
-        # \Marked - folder has been marked as "interesting" 
-        if await has_new_messages(self.path):
-            attributes.append("\\Marked")
-        else:
-            attributes.append("\\Unmarked")
+        # \Marked - folder has been marked as "interesting"
+        try:
+            with os.scandir(self._new_dir) as it:
+                has_new_messages = next((True for _ in it), False)
+        except OSError:
+            has_new_messages = False
+        attributes.append("\\Marked" if has_new_messages else "\\Unmarked")
 
-        # \HasChildren / \HasNoChildren (IMAP4rev1 extension)
-        if len(self.maildir.list_folders()) == 0:
+        # Maildir++ subfolders are the dot-directories of this folder
+        try:
+            with os.scandir(self.path) as it:
+                has_subfolders = any(entry.name.startswith('.') and len(entry.name) > 1 and entry.is_dir()
+                                     for entry in it)
+        except OSError:
+            has_subfolders = False
+        if not has_subfolders:
             attributes.append("\\Noinferiors")
 
         return attributes
 
+    async def get_folder_attributes(self) -> List[str]:
+        return await asyncio.to_thread(self._collect_folder_attributes)
+
     async def get_uid_from_key(self, key: str) -> Optional[int]:
         """Get the UID of a message by its key"""
-        await self._sync_uids()
-        folder_uid_data = await self._get_folder_uid_data()
+        folder_uid_data = await self._sync_uids()
         return folder_uid_data['key_to_uid'].get(key)
 
     async def get_key_from_uid(self, uid: int) -> Optional[str]:
         """Get the key of a message by its UID"""
-        await self._sync_uids()
-        folder_uid_data = await self._get_folder_uid_data()
+        folder_uid_data = await self._sync_uids()
         return folder_uid_data['uid_to_key'].get(uid)
 
+    def _find_message_file(self, key: str) -> Optional[Tuple[str, str]]:
+        """Locate a message file by key, returning its path and current flags"""
+        colon = self.maildir.colon
+        prefix = key + colon
+        for sub_dir in (self._cur_dir, self._new_dir):
+            with os.scandir(sub_dir) as it:
+                for entry in it:
+                    name = entry.name
+                    if name == key or name.startswith(prefix):
+                        info = name[len(prefix):] if name != key else ''
+                        return entry.path, info[2:] if info.startswith('2,') else ''
+        return None
+
+    def _set_flags_by_rename(self, path: str, flags: str) -> str:
+        """Store flags in the filename and move the message to cur/, without rewriting it"""
+        colon = self.maildir.colon
+        key = os.path.basename(path).split(colon, 1)[0]
+        new_path = os.path.join(self._cur_dir, f"{key}{colon}2,{''.join(sorted(set(flags)))}")
+        if new_path != path:
+            os.rename(path, new_path)
+            self._file_paths[key] = new_path
+            # The cached copy still carries the old flags and subdir
+            self._msg_cache.pop(key, None)
+            # mtime resolution can hide a rename made within the same tick
+            self._invalidate_stats()
+        return new_path
+
     async def mark_message_as_seen(self, key: str) -> bool:
         """Mark a message as seen by moving it to cur/ and adding the Seen flag"""
         def move_and_flag():
             with self._lock:
                 try:
-                    message = self.maildir.get_message(key)
-                    if not message:
+                    found = self._find_message_file(key)
+                    if not found:
                         return False
                     
-                    current_flags = message.get_flags()
+                    path, current_flags = found
                     if 'S' not in current_flags:
-                        new_flags = current_flags + 'S'
-                        message.set_flags(new_flags)
-                        self.maildir[key] = message
+                        self._set_flags_by_rename(path, current_flags + 'S')
                         return True
                     return False
-                except (KeyError, OSError) as e:
+                except OSError as e:
                     print(f"Error marking message as seen: {e}")
                     return False
 
@@ -328,14 +741,13 @@ class MaildirWrapper:
         def update_flags():
             with self._lock:
                 try:
-                    message = self.maildir.get_message(key)
-                    if not message:
+                    found = self._find_message_file(key)
+                    if not found:
                         return False
                     
-                    message.set_flags(flags)
-                    self.maildir[key] = message
+                    self._set_flags_by_rename(found[0], flags)
                     return True
-                except (KeyError, OSError) as e:
+                except OSError as e:
                     print(f"Error setting message flags: {e}")
                     return False
 
@@ -352,14 +764,16 @@ class MaildirWrapper:
                     
                     current_flags = message.get_flags()
                     if 'S' not in current_flags:
-                        new_flags = current_flags + 'S'
-                        message.set_flags(new_flags)
-                        self.maildir[key] = message
-                        message = self.maildir.get_message(key)
+                        found = self._find_message_file(key)
+                        if found:
+                            self._set_flags_by_rename(found[0], current_flags + 'S')
+                            # Mirror the rename on the copy we already read
+                            message.set_subdir('cur')
+                            message.set_flags(current_flags + 'S')
                     
                     return message
                 except (KeyError, OSError) as e:
                     print(f"Error getting message with seen flag: {e}")
                     return None
 
-        return await asyncio.to_thread(get_and_mark)
\ No newline at end of file
+        return await asyncio.to_thread(get_and_mark)
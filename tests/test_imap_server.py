@@ -0,0 +1,53 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+from server.imap_server import FetchProcessor, IMAPContext
+from server.storage_manager import MaildirWrapper
+
+# CRLF line endings and a folded header, which a re-serialization would not reproduce byte for byte
+MESSAGE = (b'From: a@example.com\r\n'
+           b'Subject: a subject that\r\n'
+           b' is folded\r\n'
+           b'\r\n'
+           b'body\r\n')
+
+
+class FetchSizeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        mailbox = await MaildirWrapper.create(os.path.join(tmp.name, 'user'), create=True)
+        await mailbox.save_message(MESSAGE)
+        await mailbox.flush()
+        self.context = IMAPContext(tmp.name)
+        self.context.authenticated_user = 'user'
+        self.context.selected_folder = 'INBOX'
+        self.processor = FetchProcessor()
+
+    async def fetch(self, item_names: str) -> bytes:
+        return b''.join(await self.processor.handle_seq_fetch('A1', '1', item_names, self.context))
+
+    async def test_raw_and_parsed_paths_agree(self):
+        # RFC822.SIZE and RFC822 alone are answered from the file; ENVELOPE forces a parse
+        for item_names in ('(RFC822.SIZE RFC822)', '(RFC822.SIZE RFC822 ENVELOPE)'):
+            with self.subTest(item_names=item_names):
+                response = await self.fetch(item_names)
+                self.assertIn(b'RFC822.SIZE %d' % len(MESSAGE), response)
+                self.assertIn(b'RFC822 {%d}\r\n' % len(MESSAGE) + MESSAGE, response)
+
+    async def test_body_section_matches_size(self):
+        response = await self.fetch('(RFC822.SIZE BODY.PEEK[])')
+        size = int(re.search(rb'RFC822\.SIZE (\d+)', response).group(1))
+        self.assertEqual(size, len(MESSAGE))
+        self.assertIn(b'{%d}\r\n' % size + MESSAGE, response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import smtplib
+import socket
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+# smtp_client reads its config from argv at import time
+with mock.patch.object(sys, 'argv', [sys.argv[0], str(ROOT / 'config.json')]):
+    from client.smtp_client import PipelinedSMTP
+
+
+class StubSMTPServer(threading.Thread):
+    """One-connection SMTP server answering from a script of canned replies.
+
+    With pipelining enabled it holds every reply until the DATA command has
+    arrived, so a client that waits between commands would deadlock.
+    """
+
+    def __init__(self, pipelining: bool, mail: str = '250 OK', rcpt=(), data: str = '354 Go ahead',
+                 end: str = '250 Queued'):
+        super().__init__(daemon=True)
+        self.pipelining = pipelining
+        self.replies = {'MAIL': mail, 'DATA': data, 'END': end}
+        self.rcpt_replies = list(rcpt)
+        self.commands = []
+        self.message = b''
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+
+    def run(self) -> None:
+        conn, _ = self.listener.accept()
+        self.listener.close()
+        with conn, conn.makefile('rb') as reader:
+            conn.sendall(b'220 stub ready\r\n')
+            held = []
+            for line in reader:
+                verb = line.split(b' ', 1)[0].strip().upper().decode()
+                self.commands.append(verb)
+                if verb == 'EHLO':
+                    extensions = b'250-PIPELINING\r\n' if self.pipelining else b''
+                    conn.sendall(b'250-stub\r\n' + extensions + b'250 SIZE 1000000\r\n')
+                    continue
+                if verb == 'QUIT':
+                    conn.sendall(b'221 Bye\r\n')
+                    return
+                if verb == 'RCPT':
+                    reply = self.rcpt_replies.pop(0) if self.rcpt_replies else '250 OK'
+                else:
+                    reply = self.replies.get(verb, '250 OK')
+                held.append(reply.encode() + b'\r\n')
+                if self.pipelining and verb in ('MAIL', 'RCPT'):
+                    continue
+                conn.sendall(b''.join(held))
+                held.clear()
+                if verb == 'DATA' and reply.startswith('354'):
+                    lines = []
+                    for data_line in reader:
+                        if data_line == b'.\r\n':
+                            break
+                        lines.append(data_line)
+                    else:
+                        return
+                    self.message = b''.join(lines)
+                    conn.sendall(self.replies['END'].encode() + b'\r\n')
+
+
+class PipelinedSMTPTest(unittest.TestCase):
+
+    def connect(self, **kwargs):
+        self.server = StubSMTPServer(**kwargs)
+        self.server.start()
+        client = PipelinedSMTP('127.0.0.1', self.server.port, timeout=5)
+        self.addCleanup(client.close)
+        return client
+
+    def finish(self, client):
+        if client.sock is not None:
+            client.quit()
+        self.server.join(5)
+
+    def test_pipelined_batch(self):
+        client = self.connect(pipelining=True)
+        refused = client.sendmail('a@x', ['b@x', 'c@x'], 'Subject: hi\n\n.dot\nbody\n')
+        self.finish(client)
+        self.assertEqual(refused, {})
+        self.assertEqual(self.server.commands, ['EHLO', 'MAIL', 'RCPT', 'RCPT', 'DATA', 'QUIT'])
+        self.assertEqual(self.server.message, b'Subject: hi\r\n\r\n..dot\r\nbody\r\n')
+
+    def test_falls_back_without_pipelining(self):
+        client = self.connect(pipelining=False)
+        refused = client.sendmail('a@x', ['b@x', 'c@x'], 'Subject: hi\n\nbody\n')
+        self.finish(client)
+        self.assertFalse(client.has_extn('pipelining'))
+        self.assertEqual(refused, {})
+        self.assertEqual(self.server.commands, ['EHLO', 'MAIL', 'RCPT', 'RCPT', 'DATA', 'QUIT'])
+        self.assertEqual(self.server.message, b'Subject: hi\r\n\r\nbody\r\n')
+
+    def test_some_recipients_refused(self):
+        client = self.connect(pipelining=True, rcpt=['550 No such user', '250 OK'])
+        refused = client.sendmail('a@x', ['b@x', 'c@x'], 'body')
+        self.finish(client)
+        self.assertEqual(refused, {'b@x': (550, b'No such user')})
+        self.assertEqual(self.server.message, b'body\r\n')
+
+    def test_sender_refused_resets(self):
+        client = self.connect(pipelining=True, mail='550 Sender rejected', rcpt=['503 Need MAIL'],
+                              data='503 Need RCPT')
+        with self.assertRaises(smtplib.SMTPSenderRefused) as caught:
+            client.sendmail('a@x', ['b@x'], 'body')
+        self.finish(client)
+        self.assertEqual(caught.exception.smtp_code, 550)
+        self.assertEqual(self.server.commands, ['EHLO', 'MAIL', 'RCPT', 'DATA', 'RSET', 'QUIT'])
+
+    def test_all_recipients_refused_resets(self):
+        client = self.connect(pipelining=True, rcpt=['550 No', '551 Moved'], data='554 No valid recipients')
+        with self.assertRaises(smtplib.SMTPRecipientsRefused) as caught:
+            client.sendmail('a@x', ['b@x', 'c@x'], 'body')
+        self.finish(client)
+        self.assertEqual(set(caught.exception.recipients), {'b@x', 'c@x'})
+        self.assertEqual(self.server.commands[-2:], ['RSET', 'QUIT'])
+
+    def test_all_recipients_refused_after_data_opened_closes(self):
+        client = self.connect(pipelining=True, rcpt=['550 No'])
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            client.sendmail('a@x', ['b@x'], 'body')
+        self.assertIsNone(client.sock)
+        self.server.join(5)
+        self.assertEqual(self.server.commands, ['EHLO', 'MAIL', 'RCPT', 'DATA'])
+        self.assertEqual(self.server.message, b'')
+
+    def test_data_refused_resets(self):
+        client = self.connect(pipelining=True, data='451 Try later')
+        with self.assertRaises(smtplib.SMTPDataError) as caught:
+            client.sendmail('a@x', ['b@x'], 'body')
+        self.finish(client)
+        self.assertEqual(caught.exception.smtp_code, 451)
+        self.assertEqual(self.server.commands[-2:], ['RSET', 'QUIT'])
+
+    def test_final_reply_refused_resets(self):
+        client = self.connect(pipelining=True, end='552 Too big')
+        with self.assertRaises(smtplib.SMTPDataError) as caught:
+            client.sendmail('a@x', ['b@x'], 'body')
+        self.finish(client)
+        self.assertEqual(caught.exception.smtp_code, 552)
+        self.assertEqual(self.server.commands[-2:], ['RSET', 'QUIT'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+from server import storage_manager
+from server.storage_manager import MaildirWrapper
+
+
+def _message(n: int) -> bytes:
+    return b'Subject: message %d\r\n\r\nbody %d\r\n' % (n, n)
+
+
+def _set_dir_mtimes(folder_path: str, mtime: float) -> None:
+    for sub_dir in ('cur', 'new'):
+        os.utime(os.path.join(folder_path, sub_dir), (mtime, mtime))
+
+
+class LongLivedWrapperTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.mail_dir = os.path.join(tmp.name, 'user')
+
+    async def deliver(self, n: int) -> int:
+        # SMTP delivery opens a fresh wrapper per message and flushes it
+        wrapper = await MaildirWrapper.create(self.mail_dir, create=True)
+        uid = await wrapper.save_message(_message(n))
+        await wrapper.flush()
+        return uid
+
+    def stored_folder(self) -> dict:
+        with open(os.path.join(self.mail_dir, '.uid_mapping'), 'rb') as f:
+            return json.load(f)['folders']['INBOX']
+
+    async def test_pooled_wrapper_follows_deliveries(self):
+        pooled = await MaildirWrapper.create(self.mail_dir, create=True)
+        self.assertEqual(await pooled.get_uid_key_pairs(), [])
+
+        delivered = [await self.deliver(n) for n in range(1, 5)]
+        self.assertEqual(delivered, [1, 2, 3, 4])
+
+        # Another process expunges the first message
+        first_key = dict(self.stored_folder()['uid_pairs'])[1]
+        for sub_dir in ('new', 'cur'):
+            for name in os.listdir(os.path.join(self.mail_dir, sub_dir)):
+                if name.startswith(first_key):
+                    os.remove(os.path.join(self.mail_dir, sub_dir, name))
+
+        pairs = await pooled.get_uid_key_pairs()
+        self.assertEqual([uid for uid, _ in pairs], [2, 3, 4])
+        self.assertEqual(await pooled.get_uidnext(), 5)
+
+        await pooled.flush()
+        stored = self.stored_folder()
+        self.assertEqual(sorted(uid for uid, _ in stored['uid_pairs']), [2, 3, 4])
+        self.assertEqual(stored['uidnext'], 5)
+
+        # UIDs are never reused after the pooled wrapper's write
+        self.assertEqual(await self.deliver(5), 5)
+
+
+class FolderStatsCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_cache_is_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(storage_manager, 'MAX_CACHED_FOLDER_STATS', 2):
+            paths = []
+            for name in ('a', 'b', 'c'):
+                wrapper = await MaildirWrapper.create(os.path.join(tmp, name), create=True)
+                await wrapper.save_message(_message(1))
+                await wrapper.flush()
+                # Scans only vouch for mtimes well in the past
+                _set_dir_mtimes(wrapper.path, time.time() - 60)
+                self.assertEqual(await wrapper.get_message_count(), 1)
+                paths.append(wrapper.path)
+            cached = [path for path in paths if path in storage_manager._FOLDER_STATS]
+            self.assertEqual(cached, paths[1:])
+
+            # The shared entry holds counts only; a fresh wrapper still scans for its own keys
+            fresh = await MaildirWrapper.create(os.path.join(tmp, 'c'))
+            self.assertEqual(await fresh.get_message_count(), 1)
+            self.assertEqual(len(fresh.get_keys_safe()), 1)
+
+
+
+class SameTickChangeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_change_hidden_by_mtime_resolution_is_seen(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            mail_dir = os.path.join(tmp, 'user')
+            pooled = await MaildirWrapper.create(mail_dir, create=True)
+            await pooled.save_message(_message(1))
+            await pooled.flush()
+            tick = time.time()
+            _set_dir_mtimes(mail_dir, tick)
+            self.assertEqual(len(await pooled.get_uid_key_pairs()), 1)
+            self.assertEqual(await pooled.get_message_count(), 1)
+
+            # A delivery within the same tick leaves the directory mtimes unchanged
+            other = await MaildirWrapper.create(mail_dir)
+            await other.save_message(_message(2))
+            await other.flush()
+            _set_dir_mtimes(mail_dir, tick)
+
+            self.assertEqual(len(await pooled.get_uid_key_pairs()), 2)
+            self.assertEqual(await pooled.get_message_count(), 2)
+            fresh = await MaildirWrapper.create(mail_dir)
+            self.assertEqual(await fresh.get_message_count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()